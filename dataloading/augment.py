@@ -0,0 +1,160 @@
+import sys
+import time
+import numpy as np
+
+"""
+Batched augmentation of point clouds
+All random parameters of a batch are drawn at once and every step works on the whole (B, N, 3) batch:
+rotation and scaling are combined into one (B, 3, 3) matrix per sample and applied with a single batched matmul,
+jitter is one normal draw and dropout and resampling are index selections, which are applied to the labels as well.
+Skeleton nodes of the samples get the same rotation and scaling as their point clouds, but no jitter.
+
+Usage:
+augment = BatchAugmentation(num_points=1024, seed=0)
+for pcl, seg, indices in data.iter_split("train", 32, shuffle=True):
+    pcl, seg = augment(pcl, seg)
+
+Benchmark:
+python -m dataloading.augment [batch_size]
+"""
+
+ROTATION_AXES = [None, "x", "y", "z", "all"]
+
+def rotation_matrices(rng, batch_size, axis="z"):
+    if axis == "all":
+        # uniformly distributed rotations from normalized random quaternions
+        q = rng.standard_normal((batch_size, 4))
+        q /= np.linalg.norm(q, axis=1, keepdims=True)
+        w, x, y, z = q.T
+        return np.stack([
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=1),
+            np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=1),
+            np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=1),
+        ], axis=1)
+
+    matrices = np.tile(np.eye(3), (batch_size, 1, 1))
+    if axis is None:
+        return matrices
+
+    # the two axes spanning the plane of the rotation
+    i, j = {"x": (1, 2), "y": (2, 0), "z": (0, 1)}[axis]
+    angles = rng.uniform(0, 2 * np.pi, batch_size)
+    cos, sin = np.cos(angles), np.sin(angles)
+    matrices[:, i, i] = cos
+    matrices[:, i, j] = -sin
+    matrices[:, j, i] = sin
+    matrices[:, j, j] = cos
+    return matrices
+
+def apply_transform(points, matrices):
+    # (B, N, 3) x (B, 3, 3)^T in one batched matmul
+    return np.matmul(points, matrices.transpose(0, 2, 1).astype(points.dtype))
+
+def transform_nodes(nodes, matrices):
+    # skeletons have a different number of nodes per sample, they are transformed together as one flat array
+    if isinstance(nodes, np.ndarray) and nodes.ndim == 3:
+        return apply_transform(nodes, matrices)
+
+    nodes = [np.asarray(n, dtype=np.float32) for n in nodes]
+    sizes = [len(n) for n in nodes]
+    flat = np.concatenate(nodes) if len(nodes) > 0 else np.zeros((0, 3), dtype=np.float32)
+    sample = np.repeat(np.arange(len(nodes)), sizes)
+    flat = np.einsum("nij,nj->ni", matrices.astype(np.float32)[sample], flat)
+    return np.split(flat, np.cumsum(sizes)[:-1])
+
+class BatchAugmentation:
+    """
+    Random rotation, scaling, jitter, point dropout and resampling of (pcl, seg) batches.
+
+    rotation: None, 'x', 'y', 'z' (random angle around that axis) or 'all' (uniform random rotation)
+    scale: (low, high) range of the scale factor, anisotropic=True draws one factor per axis
+    jitter: standard deviation of the gaussian noise added to every point, clipped at jitter_clip
+    dropout: maximal share of points that is dropped, the dropped points are replaced by the first point of the sample,
+             so the batch keeps its shape
+    num_points: number of points that are drawn without replacement from every sample (None keeps all)
+    """
+
+    def __init__(self, rotation="z", scale=(0.8, 1.2), anisotropic=False, jitter=0.01, jitter_clip=0.05,
+                 dropout=0.0, num_points=None, seed=None):
+        if rotation not in ROTATION_AXES:
+            raise ValueError("Unknown rotation '{}', expected one of {}".format(rotation, ROTATION_AXES))
+        if not 0 <= dropout < 1:
+            raise ValueError("dropout has to be in [0, 1)")
+
+        self.rotation = rotation
+        self.scale = scale
+        self.anisotropic = anisotropic
+        self.jitter = jitter
+        self.jitter_clip = jitter_clip
+        self.dropout = dropout
+        self.num_points = num_points
+        self.rng = np.random.default_rng(seed)
+
+    def sample_matrices(self, batch_size):
+        matrices = rotation_matrices(self.rng, batch_size, self.rotation)
+        if self.scale is not None:
+            low, high = self.scale
+            factors = self.rng.uniform(low, high, (batch_size, 3 if self.anisotropic else 1))
+            # scaling after the rotation scales the rows of the rotation matrix
+            matrices *= np.broadcast_to(factors, (batch_size, 3))[:, :, None]
+        return matrices
+
+    def sample_indices(self, batch_size, num_points):
+        indices = np.broadcast_to(np.arange(num_points), (batch_size, num_points))
+
+        if self.dropout > 0:
+            ratios = self.rng.uniform(0, self.dropout, (batch_size, 1))
+            dropped = self.rng.random((batch_size, num_points)) < ratios
+            indices = np.where(dropped, 0, indices)
+
+        if self.num_points is not None and self.num_points != num_points:
+            if self.num_points > num_points:
+                raise ValueError("Can not draw {} points from samples with {} points".format(self.num_points, num_points))
+            # the smallest random keys are a random subset without replacement
+            keys = self.rng.random((batch_size, num_points))
+            selected = np.argpartition(keys, self.num_points - 1, axis=1)[:, :self.num_points]
+            indices = np.take_along_axis(indices, selected, axis=1)
+
+        return indices
+
+    def __call__(self, pcl, seg=None, nodes=None):
+        pcl = np.asarray(pcl)
+        batch_size, num_points, _ = pcl.shape
+
+        matrices = self.sample_matrices(batch_size)
+        indices = self.sample_indices(batch_size, num_points)
+
+        pcl = np.take_along_axis(pcl, indices[:, :, None], axis=1)
+        pcl = apply_transform(pcl, matrices)
+        if self.jitter > 0:
+            noise = self.rng.standard_normal(pcl.shape, dtype=np.float32) * np.float32(self.jitter)
+            if self.jitter_clip is not None:
+                np.clip(noise, -self.jitter_clip, self.jitter_clip, out=noise)
+            pcl += noise
+
+        result = [pcl]
+        if seg is not None:
+            result.append(np.take_along_axis(np.asarray(seg), indices, axis=1))
+        if nodes is not None:
+            result.append(transform_nodes(nodes, matrices))
+        return tuple(result) if len(result) > 1 else pcl
+
+def main(argv):
+    batch_size = int(argv[1]) if len(argv) > 1 else 32
+    rng = np.random.default_rng(0)
+    pcl = rng.random((batch_size, 2048, 3), dtype=np.float32)
+    seg = rng.integers(0, 5, (batch_size, 2048), dtype=np.uint8)
+    nodes = [rng.random((rng.integers(50, 200), 3), dtype=np.float32) for _ in range(batch_size)]
+
+    augment = BatchAugmentation(rotation="all", anisotropic=True, dropout=0.2, num_points=1024, seed=0)
+    augment(pcl, seg, nodes)
+
+    repeats = 20
+    start = time.perf_counter()
+    for _ in range(repeats):
+        augment(pcl, seg, nodes)
+    duration = (time.perf_counter() - start) / repeats
+    print("batch of {}: {:.2f} ms per batch, {:.3f} ms per sample".format(batch_size, 1000 * duration, 1000 * duration / batch_size))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,194 @@
+import os
+import pathlib
+import numpy as np
+
+from .batch import load_batch
+from .cache import SampleCache
+from .fps import FPSCache, resample_batch
+from .packed import PackedData, get_split
+from .prefetch import iter_batches, split_indices
+from .npz import read_members
+from .skeleton import DISTANCE_FIELDS, LazySkeleton, is_up_to_date
+from .statistics import ClassIndex
+
+"""
+Common base of the dataset classes
+A dataset only declares its file layout, splits, points per sample and classes as class attributes, the loading code is shared.
+The paths in `paths` are format strings relative to the dataset folder with the fields set_id and sample_id.
+All paths of a set are formatted once on first use and then served from a per set list,
+so the hot loading loops only do a dict lookup instead of building pathlib paths for every sample.
+
+Other layouts, e.g. in-house DLO sets, are added by subclassing:
+
+class CableData(PointDataset):
+    paths = {"pcl": "{set_id:02d}/pcl/{sample_id:05d}.npy",
+             "seg": "{set_id:02d}/seg/{sample_id:05d}.npy",
+             "skeleton": "{set_id:02d}/skeletons/{sample_id:05d}.npz",
+             "skeleton_distance": "{set_id:02d}/skeleton_distances/{sample_id:05d}.npz"}
+    splits = {"train": range(0, 8), "val": range(8, 9), "test": range(9, 10)}
+    samples_per_set = 1000
+    num_points = 4096
+    num_classes = 3
+    rare_classes = [1, 2]
+"""
+
+class PointDataset:
+
+    paths = {}
+    splits = {}
+    samples_per_set = 0
+    num_points = 2048
+    num_classes = 0
+    rare_classes = []
+
+    def __init__(self, data_path, packed_path=None, cache_bytes=0, fps_cache_path=None, class_index_path=None):
+        self.data_path = pathlib.Path(data_path)
+        # if a packed copy of the dataset exists, pcl and seg are served from the memory mapped arrays
+        self.packed = PackedData(packed_path) if packed_path is not None else None
+        # optional LRU cache of loaded samples, limited to cache_bytes
+        self.cache = SampleCache(cache_bytes) if cache_bytes > 0 else None
+        self.class_index = None
+        # location of the class count index, default is class_counts.npz in the dataset folder (e.g. elsewhere for read only mounts)
+        self.class_index_path = class_index_path
+        # optional folder to store the farthest point sampling indices for other resolutions
+        self.fps_cache = FPSCache(self, fps_cache_path) if fps_cache_path is not None else None
+        # (kind, set_id) -> list of the paths of all samples of the set
+        self._set_paths = {}
+        # (set_id, sample_id) -> zip directories of the skeleton and its valid sidecar (None if there is none), kept with the cache,
+        # so repeated skeleton lookups with cached members do not touch the files
+        self._skeleton_members = {}
+
+    def get_train_split(self):
+        return list(self.splits["train"])
+
+    def get_val_split(self):
+        return list(self.splits["val"])
+
+    def get_test_split(self):
+        return list(self.splits["test"])
+
+    def get_samples_per_set(self):
+        return self.samples_per_set
+
+    def get_num_points(self):
+        return self.num_points
+
+    def get_num_classes(self):
+        return self.num_classes
+
+    def get_rare_classes(self):
+        return list(self.rare_classes)
+
+    # paths of all samples of a set as str, formatted on first use
+    def get_set_paths(self, kind, set_id):
+        key = (kind, int(set_id))
+        set_paths = self._set_paths.get(key)
+        if set_paths is None:
+            if kind not in self.paths:
+                raise ValueError("Unknown kind '{}', expected one of {}".format(kind, list(self.paths)))
+            prefix = str(self.data_path) + os.sep
+            template = self.paths[kind]
+            set_paths = [prefix + template.format(set_id=int(set_id), sample_id=sample_id) for sample_id in range(self.samples_per_set)]
+            self._set_paths[key] = set_paths
+        return set_paths
+
+    def get_path(self, kind, set_id, sample_id):
+        # the list would also accept negative indices, which belong to other samples
+        if not 0 <= sample_id < self.samples_per_set:
+            raise IndexError("Sample {} is not in [0, {})".format(sample_id, self.samples_per_set))
+        return self.get_set_paths(kind, set_id)[sample_id]
+
+    def get_pcl_path(self, set_id, sample_id):
+        return self.get_path("pcl", set_id, sample_id)
+
+    def get_seg_path(self, set_id, sample_id):
+        return self.get_path("seg", set_id, sample_id)
+
+    def get_skeleton_path(self, sample, sample_id):
+        return self.get_path("skeleton", sample, sample_id)
+
+    def _load(self, kind, set_id, sample_id):
+        if self.packed is not None and self.packed.has_set(set_id):
+            return self.packed.load_pcl(set_id, sample_id) if kind == "pcl" else self.packed.load_seg(set_id, sample_id)
+        if self.cache is not None:
+            return self.cache.get_or_load((int(set_id), int(sample_id), kind), np.load, self.get_path(kind, set_id, sample_id))
+        return np.load(self.get_path(kind, set_id, sample_id))
+
+    def load_pcl(self, set_id, sample_id):
+        return self._load("pcl", set_id, sample_id)
+
+    def load_seg(self, set_id, sample_id):
+        return self._load("seg", set_id, sample_id)
+
+    # indices is an array of (set_id, sample_id) pairs
+    # the batch is written into out if given, which can be reused between batches
+    def load_pcl_batch(self, indices, out=None):
+        return load_batch(self, "pcl", indices, out)
+
+    def load_seg_batch(self, indices, out=None):
+        return load_batch(self, "seg", indices, out)
+
+    # pcl and seg resampled to num_points with farthest point sampling
+    def load_resampled(self, set_id, sample_id, num_points):
+        pcl, seg = resample_batch(self, [[set_id, sample_id]], num_points, self.fps_cache)
+        return pcl[0], seg[0]
+
+    def load_resampled_batch(self, indices, num_points):
+        return resample_batch(self, indices, num_points, self.fps_cache)
+
+    # iterate over a split ('train', 'val', 'test' or a list of set ids) in (pcl, seg, indices) batches
+    # the next prefetch batches are read by a pool of worker threads in the background
+    def iter_split(self, split, batch_size, prefetch=2, workers=4, shuffle=False, seed=None, drop_last=False):
+        return iter_batches(self, split_indices(self, split), batch_size, prefetch, workers, shuffle, seed, drop_last)
+
+    # the skeleton is a read only mapping ('nodes', 'adj' and 'edges' if stored) that loads its members on first access
+    # if they were precomputed (python -m dataloading.distances) and are up to date, it also holds 'nearest_edge', 'distance' and 't'
+    # of every point, nearest_edge indexes the edges in file order. The sidecar is only checked if fields is None or names one of them
+    # fields restricts it to these members, with mmap=True members stored uncompressed are memory mapped
+    # with sparse=True a Skeleton with an int32 edge list and CSR neighbour index is returned instead of the mapping,
+    # its nearest_edge, distance and t attributes hold the point distances with nearest_edge indexing Skeleton.edges
+    def load_skeleton(self, sample, sample_id, sparse=False, fields=None, mmap=False):
+        fields = None if sparse else fields
+        with_sidecar = fields is None or any(name in DISTANCE_FIELDS for name in fields)
+        members, sidecar_members = self._get_skeleton_members(sample, sample_id, with_sidecar)
+        sidecar_path = self.get_path("skeleton_distance", sample, sample_id) if sidecar_members is not None else None
+        skeleton = LazySkeleton(self.get_skeleton_path(sample, sample_id), fields, mmap,
+                                self.cache, (int(sample), int(sample_id), "skeleton"), sidecar_path, members, sidecar_members)
+        if sparse:
+            return skeleton.to_skeleton()
+        return skeleton
+
+    def _get_skeleton_members(self, sample, sample_id, with_sidecar):
+        key = (int(sample), int(sample_id))
+        index = self._skeleton_members.get(key, {})
+        skeleton_path = self.get_skeleton_path(sample, sample_id)
+        if "skeleton" not in index:
+            index["skeleton"] = read_members(skeleton_path)
+
+        # a sidecar is only used if it is newer than the skeleton and the point cloud, a missing point cloud
+        # (e.g. if only the packed copy exists) means it can not be checked and it is left out
+        if with_sidecar and "sidecar" not in index:
+            index["sidecar"] = None
+            if "skeleton_distance" in self.paths:
+                sidecar_path = self.get_path("skeleton_distance", sample, sample_id)
+                if is_up_to_date(sidecar_path, [skeleton_path, self.get_pcl_path(sample, sample_id)]):
+                    index["sidecar"] = read_members(sidecar_path)
+
+        if self.cache is not None:
+            self._skeleton_members[key] = index
+        return index["skeleton"], index.get("sidecar")
+
+    # label counts per class, answered from the class_counts.npz index that is built on first use
+    def get_class_index(self):
+        if self.class_index is None:
+            self.class_index = ClassIndex(self, self.class_index_path)
+        return self.class_index
+
+    def class_counts(self, split):
+        return self.get_class_index().class_counts(get_split(self, split))
+
+    def sample_class_counts(self, set_id, sample_id):
+        return self.get_class_index().sample_class_counts(set_id, sample_id)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
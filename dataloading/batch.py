@@ -0,0 +1,73 @@
+import numpy as np
+
+def as_indices(indices):
+    indices = np.asarray(indices, dtype=np.int64)
+    if indices.ndim != 2 or indices.shape[1] != 2:
+        raise ValueError("Expected an array of (set_id, sample_id) pairs, got shape {}".format(indices.shape))
+    return indices
+
+def get_batch_buffer(out, batch_size, sample_shape, dtype):
+    if out is None:
+        return np.empty((batch_size,) + sample_shape, dtype=dtype)
+    if out.shape[1:] != sample_shape or out.shape[0] < batch_size:
+        raise ValueError("Output buffer of shape {} can not hold a batch of shape {}".format(out.shape, (batch_size,) + sample_shape))
+    # a larger buffer can be reused for smaller batches, e.g. the last one of an epoch
+    return out[:batch_size]
+
+def _read_npy_header(f):
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
+# read a .npy file directly into out without allocating a new array
+# files with a different dtype or memory order are read into a reusable scratch buffer first and then cast
+def load_npy_into(path, out, scratch=None):
+    with open(path, "rb") as f:
+        shape, fortran_order, dtype = _read_npy_header(f)
+        if shape != out.shape:
+            raise ValueError("'{}' has shape {}, expected {}".format(path, shape, out.shape))
+
+        if dtype == out.dtype and not fortran_order and out.flags.c_contiguous:
+            target = out
+        else:
+            if scratch is None:
+                scratch = {}
+            stored_shape = shape[::-1] if fortran_order else shape
+            key = (dtype.str, stored_shape)
+            if key not in scratch:
+                scratch[key] = np.empty(stored_shape, dtype=dtype)
+            target = scratch[key]
+
+        if f.readinto(memoryview(target).cast("B")) != target.nbytes:
+            raise IOError("'{}' is truncated".format(path))
+
+    if target is not out:
+        out[...] = target.T if fortran_order else target
+    return out
+
+def load_batch(data, kind, indices, out=None):
+    indices = as_indices(indices)
+    if kind == "pcl":
+        out = get_batch_buffer(out, len(indices), (data.get_num_points(), 3), np.float32)
+        get_path = data.get_pcl_path
+    elif kind == "seg":
+        out = get_batch_buffer(out, len(indices), (data.get_num_points(),), np.uint8)
+        get_path = data.get_seg_path
+    else:
+        raise ValueError("Unknown kind '{}'".format(kind))
+
+    loaded = np.zeros(len(indices), dtype=bool)
+    if data.packed is not None:
+        loaded = data.packed.load_batch(kind, indices[:, 0], indices[:, 1], out)
+
+    scratch = {}
+    for i in np.flatnonzero(~loaded):
+        set_id, sample_id = int(indices[i, 0]), int(indices[i, 1])
+        if data.cache is not None:
+            # cached samples keep the dtype of the files, so the cache is shared with load_pcl and load_seg
+            out[i] = data.cache.get_or_load((set_id, sample_id, kind), np.load, get_path(set_id, sample_id))
+        else:
+            load_npy_into(get_path(set_id, sample_id), out[i], scratch)
+
+    return out
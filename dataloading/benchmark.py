@@ -0,0 +1,235 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .datasets import DATASETS
+from .packed import pack_dataset
+from .prefetch import split_indices
+from .synthetic import synthetic_class, write_synthetic
+
+"""
+Data loading benchmark
+Writes a synthetic dataset in the layout of every dataset class (and a packed copy of it)
+and measures every access mode of the loaders on it:
+throughput in samples/s, latency percentiles per call and the peak RSS of the process.
+
+Every mode runs twice in a fresh process: the cold run starts with an empty page cache
+(the files are dropped with posix_fadvise(DONTNEED) where available) and a new dataset instance,
+the warm run repeats the same reads with the same instance, so the page cache and the SampleCache are filled.
+
+Usage:
+python -m dataloading.benchmark --sets 4 --samples 100
+python -m dataloading.benchmark --datasets wire --modes pcl batch packed --json results.json
+python -m dataloading.benchmark --modes resampled resampled_fps_cache --num-points 1024
+"""
+
+def _load_pcl(data, indices):
+    data.load_pcl(*indices[0])
+
+def _load_seg(data, indices):
+    data.load_seg(*indices[0])
+
+def _load_sample(data, indices):
+    data.load_pcl(*indices[0])
+    data.load_seg(*indices[0])
+
+def _load_batch(data, indices):
+    data.load_pcl_batch(indices)
+    data.load_seg_batch(indices)
+
+def _load_skeleton(data, indices):
+    skeleton = data.load_skeleton(*indices[0])
+    for name in skeleton:
+        skeleton[name]
+
+def _load_skeleton_nodes(data, indices):
+    data.load_skeleton(*indices[0], fields=["nodes"])["nodes"]
+
+def _load_skeleton_mmap(data, indices):
+    data.load_skeleton(*indices[0], fields=["nodes"], mmap=True)["nodes"]
+
+def _load_skeleton_sparse(data, indices):
+    data.load_skeleton(*indices[0], sparse=True)
+
+def _load_resampled(data, indices, num_points):
+    data.load_resampled(*indices[0], num_points)
+
+def _load_resampled_batch(data, indices, num_points):
+    data.load_resampled_batch(indices, num_points)
+
+# name -> (load function, whole batches per call, options of the dataset)
+# the iter_split mode has no load function, it times the batches yielded by the prefetching iterator
+# the resample modes get --num-points, with fps_cache the indices are stored in a folder of the mode (computed in the cold run)
+MODES = {
+    "pcl": (_load_pcl, False, {}),
+    "seg": (_load_seg, False, {}),
+    "sample": (_load_sample, False, {}),
+    "cache": (_load_sample, False, {"cache": True}),
+    "batch": (_load_batch, True, {}),
+    "packed": (_load_batch, True, {"packed": True}),
+    "packed_sample": (_load_sample, False, {"packed": True}),
+    "iter_split": (None, True, {}),
+    "skeleton": (_load_skeleton, False, {}),
+    "skeleton_nodes": (_load_skeleton_nodes, False, {}),
+    "skeleton_mmap": (_load_skeleton_mmap, False, {}),
+    "skeleton_sparse": (_load_skeleton_sparse, False, {}),
+    "skeleton_cache": (_load_skeleton, False, {"cache": True}),
+    "resampled": (_load_resampled, False, {"resample": True}),
+    "resampled_batch": (_load_resampled_batch, True, {"resample": True}),
+    "resampled_fps_cache": (_load_resampled, False, {"resample": True, "fps_cache": True}),
+    "resampled_batch_fps_cache": (_load_resampled_batch, True, {"resample": True, "fps_cache": True}),
+}
+
+def drop_page_cache(paths):
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        for root, _, files in os.walk(path):
+            for name in files:
+                fd = os.open(os.path.join(root, name), os.O_RDONLY)
+                try:
+                    # dirty pages are not dropped, so they are written back first
+                    os.fsync(fd)
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+    return True
+
+def get_peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _timed_pass(data, mode, indices, batch_size, workers, num_points):
+    load, batched, options = MODES[mode]
+    if options.get("resample"):
+        load = functools.partial(load, num_points=num_points)
+    latencies = []
+    start = time.perf_counter()
+
+    if load is None:
+        batches = data.iter_split(np.unique(indices[:, 0]), batch_size, workers=workers)
+        last = time.perf_counter()
+        for _ in batches:
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+    else:
+        step = batch_size if batched else 1
+        for i in range(0, len(indices), step):
+            call_start = time.perf_counter()
+            load(data, indices[i:i + step])
+            latencies.append(time.perf_counter() - call_start)
+
+    duration = time.perf_counter() - start
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "samples_per_s": len(indices) / duration,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def run_mode(job):
+    name, data_path, packed_path, num_sets, samples_per_set, mode, batch_size, workers, cache_bytes, num_points = job
+    _, _, options = MODES[mode]
+    data_class = synthetic_class(name, num_sets, samples_per_set)
+
+    # the fps indices of earlier runs are removed, so the cold run computes them
+    fps_cache_path = None
+    if options.get("fps_cache"):
+        fps_cache_path = pathlib.Path(data_path).with_name("{}_fps_{}".format(name, mode))
+        shutil.rmtree(fps_cache_path, ignore_errors=True)
+
+    cold = drop_page_cache([data_path, packed_path])
+    data = data_class(data_path,
+                      packed_path=packed_path if options.get("packed") else None,
+                      cache_bytes=cache_bytes if options.get("cache") else 0,
+                      fps_cache_path=fps_cache_path)
+    indices = split_indices(data, list(range(num_sets)))
+
+    result = {"dataset": name, "mode": mode, "unit": "batch" if MODES[mode][1] else "sample"}
+    result["cold"] = _timed_pass(data, mode, indices, batch_size, workers, num_points) if cold else None
+    result["warm"] = _timed_pass(data, mode, indices, batch_size, workers, num_points)
+    peak_rss = get_peak_rss()
+    result["peak_rss_mb"] = peak_rss / 2**20 if peak_rss is not None else None
+    return result
+
+def prepare(name, path, num_sets, samples_per_set, skeleton_format):
+    data_path = path / name
+    packed_path = path / (name + "_packed")
+    data = synthetic_class(name, num_sets, samples_per_set)(data_path)
+    if not data_path.exists():
+        print("Writing synthetic '{}' dataset with {} sets of {} samples".format(name, num_sets, data.get_samples_per_set()))
+        write_synthetic(data, skeleton_format=skeleton_format)
+    if not packed_path.exists():
+        pack_dataset(data, packed_path)
+    return data_path, packed_path, data.get_samples_per_set()
+
+def print_results(results):
+    print("{: <7} {: <26} {: <6} {: >12} {: >12} {: >10} {: >10} {: >10} {: >9}".format(
+        "dataset", "mode", "per", "cold smp/s", "warm smp/s", "p50 ms", "p90 ms", "p99 ms", "RSS MB"))
+    for r in results:
+        cold = "{:12.0f}".format(r["cold"]["samples_per_s"]) if r["cold"] is not None else "{: >12}".format("-")
+        rss = "{:9.0f}".format(r["peak_rss_mb"]) if r["peak_rss_mb"] is not None else "{: >9}".format("-")
+        warm = r["warm"]
+        print("{: <7} {: <26} {: <6} {} {:12.0f} {:10.3f} {:10.3f} {:10.3f} {}".format(
+            r["dataset"], r["mode"], r["unit"], cold, warm["samples_per_s"], warm["p50_ms"], warm["p90_ms"], warm["p99_ms"], rss))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the data loaders on synthetic datasets")
+    parser.add_argument("--datasets", nargs="+", choices=DATASETS, default=DATASETS)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--sets", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=100, help="samples per set")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="threads of the iter_split mode")
+    parser.add_argument("--cache-mb", type=int, default=1024, help="size of the SampleCache of the cache modes")
+    parser.add_argument("--num-points", type=int, default=1024, help="resolution of the resample modes")
+    parser.add_argument("--skeleton-format", choices=["edges", "adj"], default="edges")
+    parser.add_argument("--path", default=None, help="folder for the synthetic data, kept after the run (default: temporary folder)")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args(argv[1:])
+
+    path = pathlib.Path(args.path) if args.path is not None else pathlib.Path(tempfile.mkdtemp(prefix="cdlo_benchmark_"))
+    path.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    try:
+        for name in args.datasets:
+            data_path, packed_path, samples_per_set = prepare(name, path, args.sets, args.samples, args.skeleton_format)
+            for mode in args.modes:
+                job = (name, str(data_path), str(packed_path), args.sets, samples_per_set, mode,
+                       args.batch_size, args.workers, args.cache_mb * 2**20, args.num_points)
+                # a fresh process per mode, so the peak RSS and the caches are not shared between the modes
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    results.append(executor.submit(run_mode, job).result())
+                print("{} {} done".format(name, mode))
+    finally:
+        if args.path is None:
+            shutil.rmtree(path)
+
+    if any(r["cold"] is None for r in results):
+        print("posix_fadvise is not available, the cold runs were skipped")
+    print()
+    print_results(results)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(v.nbytes for v in value.values())
+    return value.nbytes
+
+def _freeze(value):
+    # cached arrays are shared between callers, so they must not be modified in place
+    if isinstance(value, dict):
+        for v in value.values():
+            v.flags.writeable = False
+    else:
+        value.flags.writeable = False
+    return value
+
+def _share(value):
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+class SampleCache:
+    """
+    LRU cache for loaded samples, bounded by the total number of bytes of the cached arrays.
+    Keys are (set_id, sample_id, kind) tuples, or (set_id, sample_id, 'skeleton', member) for skeletons,
+    values are arrays or dicts of arrays.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _share(self._entries[key][0])
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return value
+
+        value = _freeze(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return _share(value)
+
+    def get_or_load(self, key, load, *args):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, load(*args))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,13 @@
+DATASETS = ["wire", "vessel"]
+
+def get_dataset_class(name):
+    if name == "wire":
+        from .point_wire import WireharnessData
+        return WireharnessData
+    if name == "vessel":
+        from .point_vessel import VesselData
+        return VesselData
+    raise ValueError("Unknown dataset '{}', expected one of {}".format(name, DATASETS))
+
+def get_dataset(name, data_path, **kwargs):
+    return get_dataset_class(name)(data_path, **kwargs)
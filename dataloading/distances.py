@@ -0,0 +1,111 @@
+import argparse
+import os
+import pathlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .datasets import DATASETS, get_dataset
+from .skeleton import DISTANCE_FIELDS, is_up_to_date
+
+"""
+Point to skeleton distances
+For every point the closest skeleton edge, the distance to it and the position t in [0, 1] of the closest point on the edge.
+The edge indices refer to the edges in the order of the skeleton file, so skeleton["edges"][skeleton["nearest_edge"]] are the closest edges
+(load_skeleton(..., sparse=True) maps them to the sorted Skeleton.edges).
+
+The kernel does not build the (points, edges, 3) difference tensor: the squared distances are expanded
+into dot products, which are two matrix products per chunk of points. The chunks are sized so that the
+(points, edges) matrices stay below max_elements entries.
+
+The precompute job stores the fields next to the skeletons (skeleton_distances/ in the set folder), load_skeleton then
+returns them as 'nearest_edge', 'distance' and 't'. Sidecars older than their point cloud or skeleton are recomputed.
+python -m dataloading.distances wire /path/to/pointwire --workers 8
+"""
+
+def point_segment_distances(points, starts, ends, max_elements=2**22):
+    points = np.asarray(points, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.float64)
+    directions = np.asarray(ends, dtype=np.float64) - starts
+
+    nearest = np.full(len(points), -1, dtype=np.int32)
+    distance = np.full(len(points), np.inf, dtype=np.float32)
+    t = np.zeros(len(points), dtype=np.float32)
+    if len(starts) == 0:
+        return nearest, distance, t
+
+    # per edge terms of |p - s - t d|^2 = |p - s|^2 - 2 t (p - s).d + t^2 |d|^2
+    dd = np.einsum("ed,ed->e", directions, directions)
+    inv_dd = np.where(dd > 0, 1 / np.maximum(dd, 1e-300), 0)
+    ss = np.einsum("ed,ed->e", starts, starts)
+    sd = np.einsum("ed,ed->e", starts, directions)
+
+    chunk_size = max(1, max_elements // len(starts))
+    for begin in range(0, len(points), chunk_size):
+        p = points[begin:begin + chunk_size]
+        rr = np.einsum("pd,pd->p", p, p)[:, None] - 2 * (p @ starts.T) + ss
+        rd = p @ directions.T - sd
+
+        edge_t = np.clip(rd * inv_dd, 0, 1)
+        dist2 = rr - edge_t * (2 * rd - edge_t * dd)
+
+        rows = np.arange(len(p))
+        closest = np.argmin(dist2, axis=1)
+        nearest[begin:begin + chunk_size] = closest
+        distance[begin:begin + chunk_size] = np.sqrt(np.maximum(dist2[rows, closest], 0))
+        t[begin:begin + chunk_size] = edge_t[rows, closest]
+
+    return nearest, distance, t
+
+def skeleton_distances(points, skeleton, max_elements=2**22):
+    coords = skeleton.edge_coords()
+    return point_segment_distances(points, coords[:, 0], coords[:, 1], max_elements)
+
+# distances to the edges of a skeleton file in the order of the file
+def file_distances(points, skeleton_file, max_elements=2**22):
+    nodes = np.asarray(skeleton_file["nodes"])
+    edges = skeleton_file.file_edges()
+    return point_segment_distances(points, nodes[edges[:, 0]], nodes[edges[:, 1]], max_elements)
+
+def compute_set(job):
+    dataset, data_path, set_id, force = job
+    data = get_dataset(dataset, data_path)
+
+    computed = 0
+    for sample_id in range(data.get_samples_per_set()):
+        path = pathlib.Path(data.get_path("skeleton_distance", set_id, sample_id))
+        if not force and is_up_to_date(path, [data.get_pcl_path(set_id, sample_id), data.get_skeleton_path(set_id, sample_id)]):
+            continue
+
+        nearest, distance, t = file_distances(data.load_pcl(set_id, sample_id), data.load_skeleton(set_id, sample_id))
+
+        # stored uncompressed, so the fields can be memory mapped, and written atomically
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(tmp_path, nearest_edge=nearest, distance=distance, t=t)
+        os.replace(tmp_path, path)
+        computed += 1
+    return set_id, computed
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Precompute the closest skeleton edge of every point")
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("data_path")
+    parser.add_argument("--sets", nargs="+", type=int, default=None, help="set ids, default are all sets of the dataset")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--force", action="store_true", help="also recompute up to date files")
+    args = parser.parse_args(argv[1:])
+
+    data = get_dataset(args.dataset, args.data_path)
+    set_ids = args.sets if args.sets is not None else data.get_train_split() + data.get_val_split() + data.get_test_split()
+    jobs = [(args.dataset, args.data_path, set_id, args.force) for set_id in set_ids]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for set_id, computed in executor.map(compute_set, jobs):
+            print("Set {}: {} samples computed".format(set_id, computed))
+    print("Done in {:.1f}s".format(time.perf_counter() - start))
+
+if __name__ == "__main__":
+    main(sys.argv)
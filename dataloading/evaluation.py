@@ -0,0 +1,189 @@
+import argparse
+import sys
+import numpy as np
+
+from .batch import as_indices
+from .datasets import DATASETS, get_dataset
+from .prefetch import split_indices
+
+"""
+Streaming segmentation evaluation
+Predictions are added batch by batch, only a confusion matrix is kept, so the memory does not grow with the split.
+Every batch is counted with one bincount over the flattened (ground truth, prediction) pairs.
+Evaluators of parallel workers are combined with merge (or +), and can be stored with save and load.
+
+For the transferability benchmarks, predictions and ground truth can be mapped into a common label space:
+pred_map and gt_map are lookup tables from the labels of the model / dataset to the evaluated classes.
+Ground truth mapped to -1 is ignored, predictions mapped to -1 have no counterpart and always count as wrong.
+
+Usage (predictions stored like the segmentation files of the dataset):
+python -m dataloading.evaluation vessel /path/to/pointvessel /path/to/predictions --split test --pred-space wire
+"""
+
+CLASS_NAMES = {
+    "wire": ["wire", "endpoint", "bifurcation", "connector", "none"],
+    "vessel": ["vessel", "bifurcation"],
+    "wire_bifurcation": ["wire", "bifurcation"],
+}
+
+# label maps from the labels of a dataset into another label space, indexed with the source label
+# pairs without a map (e.g. vessel predictions, which have no endpoint, connector and none, on PointWire) are compared in the shared space
+SHARED_SPACE = "wire_bifurcation"
+LABEL_MAPS = {
+    ("wire", "vessel"): [0, 0, 1, -1, -1],
+    ("wire", "wire_bifurcation"): [0, 0, 1, -1, -1],
+    ("vessel", "wire_bifurcation"): [0, 1],
+    ("wire_bifurcation", "vessel"): [0, 1],
+}
+
+def get_label_map(source, target):
+    if source == target:
+        return None
+    if (source, target) not in LABEL_MAPS:
+        raise ValueError("No label map from '{}' to '{}'".format(source, target))
+    return np.asarray(LABEL_MAPS[(source, target)], dtype=np.int64)
+
+class SegmentationEvaluator:
+    """
+    Confusion matrix of shape (num_classes, num_classes + 1), rows are the ground truth and columns the predictions.
+    The last column counts predictions without a counterpart in the evaluated classes.
+    """
+
+    def __init__(self, num_classes, pred_map=None, gt_map=None, class_names=None):
+        self.num_classes = num_classes
+        self.pred_map = np.asarray(pred_map, dtype=np.int64) if pred_map is not None else None
+        self.gt_map = np.asarray(gt_map, dtype=np.int64) if gt_map is not None else None
+        self.class_names = list(class_names) if class_names is not None else [str(c) for c in range(num_classes)]
+        self.confusion = np.zeros((num_classes, num_classes + 1), dtype=np.int64)
+
+    @classmethod
+    def for_datasets(cls, pred_space, gt_space, target=None):
+        # e.g. for_datasets("wire", "vessel") evaluates a model trained on PointWire on PointVessel
+        if target is None:
+            target = gt_space if pred_space == gt_space or (pred_space, gt_space) in LABEL_MAPS else SHARED_SPACE
+        return cls(len(CLASS_NAMES[target]), get_label_map(pred_space, target), get_label_map(gt_space, target), CLASS_NAMES[target])
+
+    def _map(self, labels, label_map, name):
+        labels = np.asarray(labels).ravel()
+        if label_map is None:
+            if labels.size > 0 and (labels.min() < 0 or labels.max() >= self.num_classes):
+                raise ValueError("{} labels have to be in [0, {})".format(name, self.num_classes))
+            return labels.astype(np.int64)
+        if labels.size > 0 and (labels.min() < 0 or labels.max() >= len(label_map)):
+            raise ValueError("{} labels have to be in [0, {})".format(name, len(label_map)))
+        return label_map[labels]
+
+    # pred and gt are label arrays of the same shape, e.g. (B, 2048)
+    def update(self, pred, gt):
+        if np.shape(pred) != np.shape(gt):
+            raise ValueError("Predictions of shape {} do not match the ground truth of shape {}".format(np.shape(pred), np.shape(gt)))
+        pred = self._map(pred, self.pred_map, "Predicted")
+        gt = self._map(gt, self.gt_map, "Ground truth")
+
+        valid = gt >= 0
+        pred = np.where(pred[valid] >= 0, pred[valid], self.num_classes)
+        bins = gt[valid] * (self.num_classes + 1) + pred
+        self.confusion += np.bincount(bins, minlength=self.confusion.size).reshape(self.confusion.shape)
+        return self
+
+    # predictions of the samples given as (set_id, sample_id) pairs, the ground truth is read from the dataset
+    def update_samples(self, data, indices, pred):
+        return self.update(pred, data.load_seg_batch(as_indices(indices)))
+
+    def merge(self, other):
+        if other.confusion.shape != self.confusion.shape:
+            raise ValueError("Can not merge evaluators with {} and {} classes".format(self.num_classes, other.num_classes))
+        self.confusion += other.confusion
+        return self
+
+    def __add__(self, other):
+        result = SegmentationEvaluator(self.num_classes, self.pred_map, self.gt_map, self.class_names)
+        result.confusion = self.confusion.copy()
+        return result.merge(other)
+
+    def reset(self):
+        self.confusion[:] = 0
+
+    def save(self, path):
+        np.savez(path, confusion=self.confusion, class_names=np.array(self.class_names, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            evaluator = cls(len(data["class_names"]), class_names=data["class_names"])
+            evaluator.confusion[:] = data["confusion"]
+        return evaluator
+
+    def true_positives(self):
+        return np.diag(self.confusion[:, :self.num_classes])
+
+    # classes without ground truth and predictions are nan and left out of the means
+    def iou(self):
+        tp = self.true_positives()
+        union = self.confusion.sum(axis=1) + self.confusion[:, :self.num_classes].sum(axis=0) - tp
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(union > 0, tp / union, np.nan)
+
+    def accuracy(self):
+        tp = self.true_positives()
+        total = self.confusion.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(total > 0, tp / total, np.nan)
+
+    def miou(self):
+        iou = self.iou()
+        return float(np.nanmean(iou)) if not np.all(np.isnan(iou)) else float("nan")
+
+    def macc(self):
+        accuracy = self.accuracy()
+        return float(np.nanmean(accuracy)) if not np.all(np.isnan(accuracy)) else float("nan")
+
+    def overall_accuracy(self):
+        total = self.confusion.sum()
+        return float(self.true_positives().sum() / total) if total > 0 else float("nan")
+
+    def results(self):
+        return {
+            "mIoU": self.miou(),
+            "mAcc": self.macc(),
+            "OA": self.overall_accuracy(),
+            "IoU": dict(zip(self.class_names, self.iou().tolist())),
+            "Acc": dict(zip(self.class_names, self.accuracy().tolist())),
+        }
+
+    def summary(self):
+        lines = ["mIoU {:6.2f}  mAcc {:6.2f}  OA {:6.2f}".format(100 * self.miou(), 100 * self.macc(), 100 * self.overall_accuracy())]
+        for name, iou, accuracy in zip(self.class_names, self.iou(), self.accuracy()):
+            lines.append("{: <12} IoU {:6.2f}  Acc {:6.2f}".format(name, 100 * iou, 100 * accuracy))
+        return "\n".join(lines)
+
+def evaluate_split(data, pred_data, split, evaluator, batch_size=64):
+    # pred_data is a dataset instance with the predictions stored in place of the segmentation
+    indices = split_indices(data, split)
+    for start in range(0, len(indices), batch_size):
+        batch = indices[start:start + batch_size]
+        evaluator.update_samples(data, batch, pred_data.load_seg_batch(batch))
+    return evaluator
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Evaluate predictions stored in the segmentation layout of a dataset")
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("data_path")
+    parser.add_argument("pred_path")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--sets", nargs="+", type=int, default=None, help="set ids to evaluate instead of a split")
+    parser.add_argument("--pred-space", choices=list(CLASS_NAMES), default=None, help="label space of the predictions, default is the one of the dataset")
+    parser.add_argument("--target", choices=list(CLASS_NAMES), default=None, help="label space the scores are computed in, default is the one of the dataset if the predictions can be mapped to it")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args(argv[1:])
+
+    data = get_dataset(args.dataset, args.data_path)
+    pred_data = get_dataset(args.dataset, args.pred_path)
+    pred_space = args.pred_space if args.pred_space is not None else args.dataset
+    evaluator = SegmentationEvaluator.for_datasets(pred_space, args.dataset, args.target)
+
+    evaluate_split(data, pred_data, args.sets if args.sets is not None else args.split, evaluator, args.batch_size)
+    print(evaluator.summary())
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,119 @@
+import pathlib
+import sys
+import time
+import numpy as np
+
+"""
+Farthest point sampling
+Resamples the 2048 point clouds to other resolutions. The same indices are used on the segmentation,
+so pcl and seg stay consistent. The first point is always index 0, so the result is deterministic and can be cached.
+If more points than available are requested, the farthest point order is repeated.
+
+Benchmark against a naive python loop:
+python -m dataloading.fps [num_clouds] [num_samples]
+"""
+
+def farthest_point_sampling(points, num_samples):
+    points = np.asarray(points, dtype=np.float32)
+    single = points.ndim == 2
+    if single:
+        points = points[None]
+
+    batch_size, num_points, _ = points.shape
+    num_fps = min(num_samples, num_points)
+    batch = np.arange(batch_size)
+
+    indices = np.zeros((batch_size, num_fps), dtype=np.int64)
+    min_dists = np.full((batch_size, num_points), np.inf, dtype=np.float32)
+    last = np.zeros(batch_size, dtype=np.int64)
+
+    # every iteration updates the distance of all points of all clouds to the selected set at once
+    for i in range(1, num_fps):
+        diff = points - points[batch, last][:, None, :]
+        np.minimum(min_dists, np.einsum("bnd,bnd->bn", diff, diff), out=min_dists)
+        last = np.argmax(min_dists, axis=1)
+        indices[:, i] = last
+
+    if num_samples > num_points:
+        indices = indices[:, np.arange(num_samples) % num_points]
+
+    return indices[0] if single else indices
+
+def naive_farthest_point_sampling(points, num_samples):
+    indices = [0]
+    min_dists = [np.inf] * len(points)
+    for _ in range(1, min(num_samples, len(points))):
+        last = points[indices[-1]]
+        for j, p in enumerate(points):
+            min_dists[j] = min(min_dists[j], float(np.sum((p - last) ** 2)))
+        indices.append(int(np.argmax(min_dists)))
+    return np.array(indices)
+
+class FPSCache:
+    """
+    Caches the fps indices of whole sets per resolution in <cache_path>/fps_<num_points>/<set_id>.npy.
+    A set is resampled in one batched fps call the first time one of its samples is requested.
+    """
+
+    def __init__(self, data, cache_path):
+        self.data = data
+        self.cache_path = pathlib.Path(cache_path)
+        self._sets = {}
+
+    def get_set_path(self, set_id, num_points):
+        return self.cache_path / "fps_{}".format(num_points) / "{:04d}.npy".format(set_id)
+
+    def get_set(self, set_id, num_points):
+        key = (int(set_id), num_points)
+        if key in self._sets:
+            return self._sets[key]
+
+        set_path = self.get_set_path(set_id, num_points)
+        if set_path.exists():
+            indices = np.load(set_path)
+        else:
+            samples_per_set = self.data.get_samples_per_set()
+            batch = np.stack([np.full(samples_per_set, set_id), np.arange(samples_per_set)], axis=1)
+            indices = farthest_point_sampling(self.data.load_pcl_batch(batch), num_points).astype(np.int32)
+            set_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(set_path, indices)
+
+        self._sets[key] = indices
+        return indices
+
+    def get(self, set_id, sample_id, num_points):
+        return self.get_set(set_id, num_points)[sample_id]
+
+def resample_batch(data, indices, num_points, fps_cache=None):
+    pcl = data.load_pcl_batch(indices)
+    seg = data.load_seg_batch(indices)
+
+    if fps_cache is not None:
+        fps_indices = np.stack([fps_cache.get(set_id, sample_id, num_points) for set_id, sample_id in indices])
+    else:
+        fps_indices = farthest_point_sampling(pcl, num_points)
+
+    return np.take_along_axis(pcl, fps_indices[:, :, None], axis=1), np.take_along_axis(seg, fps_indices, axis=1)
+
+def main(argv):
+    num_clouds = int(argv[1]) if len(argv) > 1 else 16
+    num_samples = int(argv[2]) if len(argv) > 2 else 512
+
+    points = np.random.default_rng(0).random((num_clouds, 2048, 3), dtype=np.float32)
+
+    start = time.perf_counter()
+    naive = [naive_farthest_point_sampling(p, num_samples) for p in points[:2]]
+    naive_time = (time.perf_counter() - start) / 2
+
+    start = time.perf_counter()
+    vectorized = farthest_point_sampling(points, num_samples)
+    vectorized_time = (time.perf_counter() - start) / num_clouds
+
+    matching = all(np.array_equal(n, v) for n, v in zip(naive, vectorized))
+    print("same indices: {}".format(matching))
+    print("naive loop:   {:8.2f} ms per cloud".format(1000 * naive_time))
+    print("vectorized:   {:8.2f} ms per cloud (batch of {})".format(1000 * vectorized_time, num_clouds))
+    print("speedup:      {:8.1f}x".format(naive_time / vectorized_time))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,102 @@
+import struct
+import zipfile
+from collections.abc import Mapping
+import numpy as np
+
+from .batch import _read_npy_header
+
+"""
+Lazy access to .npz archives
+np.load returns an NpzFile that keeps the archive open, copying all members into a dict decompresses every array.
+LazyNpz only reads the zip directory when it is created and reads a member the first time it is accessed,
+the file is not kept open in between. Members stored without compression (np.savez) can be memory mapped instead of read.
+"""
+
+# size of the fixed part of a zip local file header, the name and extra field lengths are its last two fields
+_LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+
+def mmap_member(path, info):
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+        f.seek(header[-2] + header[-1], 1)
+        shape, fortran_order, dtype = _read_npy_header(f)
+        offset = f.tell()
+
+    if dtype.hasobject or int(np.prod(shape)) == 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+# member name -> ZipInfo of the arrays in the archive
+def read_members(path):
+    with zipfile.ZipFile(path) as archive:
+        return {info.filename[:-len(".npy")]: info for info in archive.infolist() if info.filename.endswith(".npy")}
+
+class LazyNpz(Mapping):
+    """
+    Read only mapping of the arrays in a .npz file, members are loaded on first access and kept afterwards.
+    fields restricts the mapping to these members. With mmap=True, uncompressed members are memory mapped.
+    If cache and key are given, loaded members are stored in the SampleCache under key + (name,).
+    members is the result of read_members(path) if it is already known, then the archive is only opened to read a member.
+    """
+
+    def __init__(self, path, fields=None, mmap=False, cache=None, key=None, members=None):
+        self.path = path
+        self.mmap = mmap
+        self.cache = cache
+        self.key = key
+        self._members = members if members is not None else read_members(path)
+
+        self._keys = self.available_keys()
+        if fields is not None:
+            missing = [name for name in fields if name not in self._keys]
+            if len(missing) > 0:
+                raise KeyError("'{}' has no members {}".format(path, missing))
+            self._keys = list(fields)
+
+        self._arrays = {}
+
+    # names that can be accessed, subclasses can add members that are computed from the stored ones
+    def available_keys(self):
+        return list(self._members)
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            if name not in self._keys:
+                raise KeyError(name)
+            self._arrays[name] = self._load(name)
+        return self._arrays[name]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def _load(self, name):
+        info = self._members.get(name)
+        if self.mmap and info is not None and info.compress_type == zipfile.ZIP_STORED:
+            array = mmap_member(self.path, info)
+            if array is not None:
+                return array
+
+        if self.cache is not None and self.key is not None:
+            return self.cache.get_or_load(self.key + (name,), self._read, name)
+        return self._read(name)
+
+    def _read(self, name):
+        return self.read_member(name)
+
+    def read_member(self, name):
+        with zipfile.ZipFile(self.path) as archive:
+            with archive.open(self._members[name]) as f:
+                return np.lib.format.read_array(f)
+
+    def is_loaded(self, name):
+        return name in self._arrays
+
+    def to_dict(self):
+        return {name: self[name] for name in self}
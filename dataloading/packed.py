@@ -0,0 +1,156 @@
+import pathlib
+import sys
+import numpy as np
+
+"""
+Packed dataset format
+Every split is stored as one contiguous pcl.npy of shape (N, num_points, 3) float32, one seg.npy of shape (N, num_points) uint8
+and an index.npz with the set ids of the split and the row offset of every set.
+The arrays are opened with np.memmap, so a whole epoch only needs a handful of file opens
+and the page cache is shared between all worker processes reading the same split.
+
+Usage:
+python -m dataloading.packed wire /path/to/pointwire /path/to/pointwire_packed
+python -m dataloading.packed vessel /path/to/pointvessel /path/to/pointvessel_packed
+"""
+
+SPLITS = ["train", "val", "test"]
+
+# split is either the name of a split or a list of set ids
+def get_split(data, split):
+    if not isinstance(split, str):
+        return list(split)
+    if split == "train":
+        return data.get_train_split()
+    if split == "val":
+        return data.get_val_split()
+    if split == "test":
+        return data.get_test_split()
+    raise ValueError("Unknown split '{}'".format(split))
+
+def pack_split(data, set_ids, output_path):
+    output_path = pathlib.Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    samples_per_set = data.get_samples_per_set()
+    offsets = np.arange(len(set_ids) + 1, dtype=np.int64) * samples_per_set
+    num_samples = int(offsets[-1])
+    num_points = data.get_num_points()
+
+    # write into memory mapped arrays, so the split never has to fit into memory
+    pcl = np.lib.format.open_memmap(output_path / "pcl.npy", mode="w+", dtype=np.float32, shape=(num_samples, num_points, 3))
+    seg = np.lib.format.open_memmap(output_path / "seg.npy", mode="w+", dtype=np.uint8, shape=(num_samples, num_points))
+
+    for i, set_id in enumerate(set_ids):
+        for sample_id in range(samples_per_set):
+            pcl[offsets[i] + sample_id] = data.load_pcl(set_id, sample_id)
+            seg[offsets[i] + sample_id] = data.load_seg(set_id, sample_id)
+
+    pcl.flush()
+    seg.flush()
+    del pcl, seg
+
+    # the index is written last, a split without index is incomplete
+    np.savez(output_path / "index.npz", set_ids=np.asarray(set_ids, dtype=np.int64), offsets=offsets)
+
+def pack_dataset(data, output_path, splits=SPLITS):
+    output_path = pathlib.Path(output_path)
+    for split in splits:
+        print("Packing split '{}'".format(split))
+        pack_split(data, get_split(data, split), output_path / split)
+
+class PackedSplit:
+
+    def __init__(self, split_path):
+        split_path = pathlib.Path(split_path)
+        index = np.load(split_path / "index.npz")
+        self.set_ids = index["set_ids"]
+        self.offsets = index["offsets"]
+        self.pcl = np.load(split_path / "pcl.npy", mmap_mode="r")
+        self.seg = np.load(split_path / "seg.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.pcl)
+
+    # position of every set id in this split, -1 for sets that are not part of it
+    def set_positions(self, set_ids):
+        if len(self.set_ids) == 0:
+            return np.full(len(set_ids), -1, dtype=np.int64)
+        order = np.argsort(self.set_ids)
+        sorted_ids = self.set_ids[order]
+        pos = np.searchsorted(sorted_ids, set_ids).clip(0, len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == set_ids, order[pos], -1)
+
+class PackedData:
+
+    def __init__(self, packed_path):
+        self.packed_path = pathlib.Path(packed_path)
+        self.splits = {}
+        self._rows = {}
+
+        for split in SPLITS:
+            if not (self.packed_path / split / "index.npz").exists():
+                continue
+            packed_split = PackedSplit(self.packed_path / split)
+            self.splits[split] = packed_split
+            for i, set_id in enumerate(packed_split.set_ids):
+                self._rows[int(set_id)] = (packed_split, int(packed_split.offsets[i]), int(packed_split.offsets[i + 1]))
+
+        if len(self.splits) == 0:
+            raise FileNotFoundError("No packed splits found in '{}'".format(self.packed_path))
+
+    def has_set(self, set_id):
+        return int(set_id) in self._rows
+
+    def _locate(self, set_id, sample_id):
+        packed_split, start, end = self._rows[int(set_id)]
+        row = start + sample_id
+        if not start <= row < end:
+            raise IndexError("Sample {} is not part of packed set {}".format(sample_id, set_id))
+        return packed_split, row
+
+    # the returned arrays are read only views into the memory mapped files
+    def load_pcl(self, set_id, sample_id):
+        packed_split, row = self._locate(set_id, sample_id)
+        return np.asarray(packed_split.pcl[row])
+
+    def load_seg(self, set_id, sample_id):
+        packed_split, row = self._locate(set_id, sample_id)
+        return np.asarray(packed_split.seg[row])
+
+    # gather a batch into out with one vectorized take per split
+    # returns a mask of the samples that were found in the packed data
+    def load_batch(self, kind, set_ids, sample_ids, out):
+        loaded = np.zeros(len(set_ids), dtype=bool)
+        for packed_split in self.splits.values():
+            pos = packed_split.set_positions(set_ids)
+            mask = pos >= 0
+            if not mask.any():
+                continue
+
+            rows = packed_split.offsets[pos[mask]] + sample_ids[mask]
+            if np.any(rows >= packed_split.offsets[pos[mask] + 1]) or np.any(sample_ids[mask] < 0):
+                raise IndexError("Batch contains samples that are not part of the packed sets")
+
+            array = packed_split.pcl if kind == "pcl" else packed_split.seg
+            if mask.all() and out.dtype == array.dtype:
+                np.take(array, rows, axis=0, out=out)
+            else:
+                out[mask] = array[rows]
+            loaded |= mask
+        return loaded
+
+def main(argv):
+    from .datasets import DATASETS, get_dataset
+
+    if len(argv) < 4 or argv[1] not in DATASETS:
+        print("Usage: python -m dataloading.packed (wire|vessel) <data_path> <output_path> [split ...]")
+        sys.exit(1)
+
+    data = get_dataset(argv[1], argv[2])
+
+    splits = argv[4:] if len(argv) > 4 else SPLITS
+    pack_dataset(data, argv[3], splits)
+
+if __name__ == "__main__":
+    main(sys.argv)
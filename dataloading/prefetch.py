@@ -0,0 +1,68 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .packed import get_split
+
+def split_indices(data, split):
+    set_ids = get_split(data, split)
+    samples_per_set = data.get_samples_per_set()
+    set_ids = np.repeat(np.asarray(set_ids, dtype=np.int64), samples_per_set)
+    sample_ids = np.tile(np.arange(samples_per_set, dtype=np.int64), len(set_ids) // samples_per_set)
+    return np.stack([set_ids, sample_ids], axis=1)
+
+def _load_chunk(data, indices, pcl, seg):
+    data.load_pcl_batch(indices, out=pcl)
+    data.load_seg_batch(indices, out=seg)
+
+def _submit_batch(executor, data, indices, workers):
+    pcl = np.empty((len(indices), data.get_num_points(), 3), dtype=np.float32)
+    seg = np.empty((len(indices), data.get_num_points()), dtype=np.uint8)
+
+    # every worker reads a contiguous chunk of the batch directly into the batch arrays
+    chunk_size = -(-len(indices) // workers)
+    futures = []
+    for start in range(0, len(indices), chunk_size):
+        end = start + chunk_size
+        futures.append(executor.submit(_load_chunk, data, indices[start:end], pcl[start:end], seg[start:end]))
+
+    return pcl, seg, indices, futures
+
+def _wait_batch(batch):
+    pcl, seg, indices, futures = batch
+    for future in futures:
+        future.result()
+    return pcl, seg, indices
+
+def iter_batches(data, indices, batch_size, prefetch=2, workers=4, shuffle=False, seed=None, drop_last=False):
+    """
+    Yields (pcl, seg, indices) batches of shape (B, N, 3), (B, N) and (B, 2) with N = data.get_num_points().
+    The next prefetch batches are read on a thread pool while the current one is processed.
+    np.load and file reads release the GIL, so the reads overlap with the computation of the caller.
+    """
+    if batch_size < 1 or workers < 1 or prefetch < 0:
+        raise ValueError("batch_size and workers must be positive and prefetch must not be negative")
+
+    indices = np.asarray(indices, dtype=np.int64)
+    if shuffle:
+        indices = indices[np.random.default_rng(seed).permutation(len(indices))]
+
+    num_batches = len(indices) // batch_size if drop_last else -(-len(indices) // batch_size)
+    batches = (indices[b * batch_size:(b + 1) * batch_size] for b in range(num_batches))
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for batch_indices in batches:
+            pending.append(_submit_batch(executor, data, batch_indices, workers))
+            if len(pending) <= prefetch:
+                continue
+            yield _wait_batch(pending.popleft())
+
+        while pending:
+            yield _wait_batch(pending.popleft())
+    finally:
+        for _, _, _, futures in pending:
+            for future in futures:
+                future.cancel()
+        executor.shutdown(wait=True)
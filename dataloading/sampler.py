@@ -0,0 +1,48 @@
+import numpy as np
+
+from .packed import get_split
+from .prefetch import split_indices
+
+class ClassBalancedSampler:
+    """
+    Draws (set_id, sample_id) pairs with a probability that grows with the amount of rare class points in the sample.
+    The weight of a sample is the share of all rare class points of the split it contains, summed over the rare classes,
+    so every rare class contributes equally no matter how rare it is.
+    uniform mixes in a uniform distribution, so samples without rare points are still drawn.
+    The weights are computed once from the class index, drawing is a binary search in their cumulative sum.
+    """
+
+    def __init__(self, data, split, rare_classes=None, uniform=0.1, power=1.0, seed=None):
+        if not 0 <= uniform <= 1:
+            raise ValueError("uniform has to be in [0, 1]")
+
+        if rare_classes is None:
+            rare_classes = data.get_rare_classes()
+        set_ids = get_split(data, split)
+
+        self.indices = split_indices(data, set_ids)
+        counts = data.get_class_index().set_class_counts(set_ids)
+        counts = counts.reshape(len(self.indices), -1)[:, rare_classes].astype(np.float64)
+
+        class_totals = counts.sum(axis=0)
+        rare_weights = (counts / np.maximum(class_totals, 1)).sum(axis=1) ** power
+        if rare_weights.sum() > 0:
+            rare_weights /= rare_weights.sum()
+        else:
+            rare_weights[:] = 1 / len(rare_weights)
+
+        self.weights = (1 - uniform) * rare_weights + uniform / len(rare_weights)
+        self.cdf = np.cumsum(self.weights)
+        self.cdf /= self.cdf[-1]
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def sample(self, num_samples):
+        rows = np.searchsorted(self.cdf, self.rng.random(num_samples), side="right")
+        return self.indices[np.minimum(rows, len(self.cdf) - 1)]
+
+    # draws one epoch with as many samples as the split contains
+    def epoch(self):
+        return self.sample(len(self.indices))
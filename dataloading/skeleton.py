@@ -0,0 +1,159 @@
+import os
+import numpy as np
+
+from .npz import LazyNpz
+
+"""
+Sparse skeleton representation
+The skeleton files store the nodes and either a dense boolean adjacency matrix 'adj' (old format)
+or an int32 edge list 'edges' of shape (E, 2).
+The Skeleton class keeps the edges and a CSR neighbour index, so all helpers are linear in the number of edges.
+LazySkeleton is the mapping returned by the dataset classes, it only loads the members that are accessed.
+The precomputed point distances ('nearest_edge', 'distance', 't') index the edges in the order of the file ('edges', or the
+upper triangle of 'adj'), Skeleton objects created with to_skeleton hold them with nearest_edge indexing Skeleton.edges.
+"""
+
+DISTANCE_FIELDS = ["nearest_edge", "distance", "t"]
+
+# a file derived from other files is valid if it and all of them exist and it is not older than any of them
+def is_up_to_date(path, sources):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        return all(os.stat(source).st_mtime_ns <= mtime for source in sources)
+    except FileNotFoundError:
+        return False
+
+class Skeleton:
+
+    def __init__(self, nodes, edges):
+        self.nodes = np.asarray(nodes, dtype=np.float32)
+        edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+
+        # store every undirected edge once with the smaller node index first
+        edges = np.unique(np.sort(edges, axis=1), axis=0)
+        self.edges = edges[edges[:, 0] != edges[:, 1]]
+
+        # CSR index: the neighbours of node i are indices[indptr[i]:indptr[i + 1]]
+        both_dirs = np.concatenate([self.edges, self.edges[:, ::-1]])
+        both_dirs = both_dirs[np.lexsort((both_dirs[:, 1], both_dirs[:, 0]))]
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(both_dirs[:, 0], minlength=len(self.nodes)), out=self.indptr[1:])
+        self.indices = np.ascontiguousarray(both_dirs[:, 1], dtype=np.int32)
+
+        # closest edge, distance and position on the edge of every point, set by LazySkeleton.to_skeleton if precomputed
+        self.nearest_edge = None
+        self.distance = None
+        self.t = None
+
+    @classmethod
+    def from_adjacency(cls, nodes, adj):
+        adj = np.asarray(adj, dtype=bool)
+        return cls(nodes, np.argwhere(np.triu(adj | adj.T, 1)))
+
+    @classmethod
+    def from_dict(cls, data):
+        if "edges" in data:
+            return cls(data["nodes"], data["edges"])
+        return cls.from_adjacency(data["nodes"], data["adj"])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def num_edges(self):
+        return len(self.edges)
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def neighbours(self, node_id):
+        return self.indices[self.indptr[node_id]:self.indptr[node_id + 1]]
+
+    def endpoints(self):
+        return np.flatnonzero(self.degree() == 1)
+
+    def bifurcations(self):
+        return np.flatnonzero(self.degree() > 2)
+
+    def iter_edges(self):
+        for i, j in self.edges:
+            yield int(i), int(j)
+
+    # start and end coordinates of every edge, shape (E, 2, 3)
+    def edge_coords(self):
+        return self.nodes[self.edges]
+
+    def edge_lengths(self):
+        coords = self.edge_coords()
+        return np.linalg.norm(coords[:, 1] - coords[:, 0], axis=1)
+
+    # index in self.edges of every given edge, -1 for self loops
+    def edge_index(self, edges):
+        edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+        index = np.full(len(edges), -1, dtype=np.int32)
+        if len(self.edges) == 0:
+            return index
+        # self.edges is sorted, so the edges are found by a binary search over i * N + j
+        keys = self.edges[:, 0].astype(np.int64) * len(self.nodes) + self.edges[:, 1]
+        query = edges[:, 0] * len(self.nodes) + edges[:, 1]
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = keys[pos] == query
+        index[found] = pos[found]
+        return index
+
+    def to_adjacency(self):
+        adj = np.zeros((len(self.nodes), len(self.nodes)), dtype=bool)
+        adj[self.edges[:, 0], self.edges[:, 1]] = True
+        adj[self.edges[:, 1], self.edges[:, 0]] = True
+        return adj
+
+    def to_dict(self):
+        return {"nodes": self.nodes, "edges": self.edges}
+
+class LazySkeleton(LazyNpz):
+    """
+    Lazily loaded skeleton file. Files with an edge list still provide the dense 'adj', which is only built when accessed.
+    If sidecar_path is given, the fields of the sidecar file with the point distances ('nearest_edge', 'distance', 't')
+    are part of the mapping as well, the caller checks that it is up to date. members and sidecar_members are the zip directories if known.
+    """
+
+    def __init__(self, path, fields=None, mmap=False, cache=None, key=None, sidecar_path=None, members=None, sidecar_members=None):
+        self._sidecar = None
+        if sidecar_path is not None:
+            self._sidecar = LazyNpz(sidecar_path, mmap=mmap, cache=cache, key=key, members=sidecar_members)
+        super().__init__(path, fields, mmap, cache, key, members)
+
+    def available_keys(self):
+        keys = list(self._members)
+        if "adj" not in self._members and "edges" in self._members:
+            keys.append("adj")
+        if self._sidecar is not None:
+            keys += [name for name in self._sidecar if name not in keys]
+        return keys
+
+    def _load(self, name):
+        if name not in self._members and self._sidecar is not None and name in self._sidecar:
+            return self._sidecar[name]
+        return super()._load(name)
+
+    def _read(self, name):
+        if name == "adj" and "adj" not in self._members:
+            return Skeleton(self._load("nodes"), self._load("edges")).to_adjacency()
+        return self.read_member(name)
+
+    # edges in the order of the file, which nearest_edge refers to
+    def file_edges(self):
+        if "edges" in self._members:
+            return self._load("edges")
+        return Skeleton.from_adjacency(self._load("nodes"), self._load("adj")).edges
+
+    def to_skeleton(self):
+        nodes = self._load("nodes")
+        edges = self.file_edges()
+        skeleton = Skeleton(nodes, edges)
+        if self._sidecar is not None:
+            # the appended -1 keeps points without an edge (nearest_edge -1) at -1
+            skeleton.nearest_edge = np.append(skeleton.edge_index(edges), -1)[self._sidecar["nearest_edge"]]
+            skeleton.distance = self._sidecar["distance"]
+            skeleton.t = self._sidecar["t"]
+        return skeleton
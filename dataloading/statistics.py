@@ -0,0 +1,129 @@
+import os
+import pathlib
+import sys
+import numpy as np
+
+from .packed import SPLITS, get_split
+
+"""
+Per sample class histograms
+The label counts of every sample are computed once and stored in a small sidecar file (class_counts.npz in the dataset folder).
+The modification times of the segmentation files are stored with them, sets with changed files are recounted automatically.
+If the index can not be written (e.g. a read only dataset folder), the counts are only kept in memory.
+
+Usage:
+python -m dataloading.statistics wire /path/to/pointwire
+"""
+
+CLASS_INDEX_FILE = "class_counts.npz"
+
+class ClassIndex:
+
+    def __init__(self, data, index_path=None, check_mtimes=True):
+        self.data = data
+        self.index_path = pathlib.Path(index_path) if index_path is not None else data.data_path / CLASS_INDEX_FILE
+        self.num_classes = data.get_num_classes()
+        self.samples_per_set = data.get_samples_per_set()
+        self.check_mtimes = check_mtimes
+        # cleared if the index can not be written, then it is not tried again
+        self.writable = True
+
+        # set_id -> (counts of shape (samples_per_set, num_classes), mtimes of shape (samples_per_set,))
+        self._sets = {}
+        self._validated = set()
+
+        if self.index_path.exists():
+            with np.load(self.index_path) as index:
+                if index["counts"].shape[1:] == (self.samples_per_set, self.num_classes):
+                    for set_id, counts, mtimes in zip(index["set_ids"], index["counts"], index["mtimes"]):
+                        self._sets[int(set_id)] = (counts, mtimes)
+
+    def _get_mtimes(self, set_id):
+        mtimes = np.zeros(self.samples_per_set, dtype=np.int64)
+        for sample_id in range(self.samples_per_set):
+            try:
+                mtimes[sample_id] = os.stat(self.data.get_seg_path(set_id, sample_id)).st_mtime_ns
+            except FileNotFoundError:
+                # only the packed copy exists
+                pass
+        return mtimes
+
+    def _count_set(self, set_id):
+        indices = np.stack([np.full(self.samples_per_set, set_id), np.arange(self.samples_per_set)], axis=1)
+        seg = self.data.load_seg_batch(indices).astype(np.int64)
+        if seg.max() >= self.num_classes:
+            raise ValueError("Set {} contains labels >= {}".format(set_id, self.num_classes))
+
+        # one bincount for the whole set, every sample gets its own range of bins
+        bins = seg + np.arange(self.samples_per_set)[:, None] * self.num_classes
+        counts = np.bincount(bins.ravel(), minlength=self.samples_per_set * self.num_classes)
+        return counts.reshape(self.samples_per_set, self.num_classes).astype(np.int32)
+
+    def update(self, set_ids):
+        changed = False
+        for set_id in set_ids:
+            set_id = int(set_id)
+            if set_id in self._validated:
+                continue
+
+            if set_id not in self._sets:
+                self._sets[set_id] = (self._count_set(set_id), self._get_mtimes(set_id))
+                changed = True
+            elif self.check_mtimes:
+                mtimes = self._get_mtimes(set_id)
+                if np.any(mtimes != self._sets[set_id][1]):
+                    self._sets[set_id] = (self._count_set(set_id), mtimes)
+                    changed = True
+            self._validated.add(set_id)
+
+        if changed and self.writable:
+            self.save()
+
+    def save(self):
+        set_ids = sorted(self._sets)
+        tmp_path = self.index_path.with_name(self.index_path.stem + ".tmp.npz")
+        try:
+            np.savez(tmp_path,
+                     set_ids=np.asarray(set_ids, dtype=np.int64),
+                     counts=np.stack([self._sets[s][0] for s in set_ids]),
+                     mtimes=np.stack([self._sets[s][1] for s in set_ids]))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print("Could not write the class index '{}', the counts are kept in memory: {}".format(self.index_path, e), file=sys.stderr)
+            self.writable = False
+            return False
+        return True
+
+    def set_class_counts(self, set_ids):
+        self.update(set_ids)
+        return np.stack([self._sets[int(s)][0] for s in set_ids])
+
+    def class_counts(self, set_ids):
+        return self.set_class_counts(set_ids).sum(axis=(0, 1), dtype=np.int64)
+
+    def sample_class_counts(self, set_id, sample_id):
+        self.update([set_id])
+        return self._sets[int(set_id)][0][sample_id]
+
+def build_class_index(data, index_path=None, splits=SPLITS):
+    class_index = ClassIndex(data, index_path)
+    for split in splits:
+        class_index.update(get_split(data, split))
+    return class_index
+
+def main(argv):
+    from .datasets import DATASETS, get_dataset
+
+    if len(argv) < 3 or argv[1] not in DATASETS:
+        print("Usage: python -m dataloading.statistics (wire|vessel) <data_path> [index_path]")
+        sys.exit(1)
+
+    data = get_dataset(argv[1], argv[2])
+    class_index = build_class_index(data, argv[3] if len(argv) > 3 else None)
+
+    for split in SPLITS:
+        counts = class_index.class_counts(get_split(data, split))
+        print("{: <6}".format(split), " ".join("{:5.1f}%".format(100 * c / counts.sum()) for c in counts))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+from .datasets import DATASETS, get_dataset_class
+
+"""
+Synthetic datasets
+Writes random samples in the folder layout of a dataset class, so the loaders can be tested and benchmarked
+without downloading the real data. Every sample is a noisy curve with random labels along it
+and a skeleton with nodes on the curve, stored as edge list (default) or dense adjacency matrix.
+The number of sets and samples per set is configurable, the splits are derived from the number of sets.
+
+Usage:
+python -m dataloading.synthetic wire /tmp/pointwire_synthetic --sets 4 --samples 100
+"""
+
+def synthetic_class(name, num_sets, samples_per_set=None):
+    base = get_dataset_class(name)
+    if samples_per_set is None:
+        samples_per_set = base.samples_per_set
+
+    # the last set is the test split, the one before the val split (if there are enough sets)
+    num_eval = 1 if num_sets >= 3 else 0
+    num_train = num_sets - 2 * num_eval
+    splits = {
+        "train": range(0, num_train),
+        "val": range(num_train, num_train + num_eval),
+        "test": range(num_train + num_eval, num_sets),
+    }
+    return type("Synthetic" + base.__name__, (base,), {"splits": splits, "samples_per_set": samples_per_set})
+
+def synthetic_sample(rng, num_classes, num_nodes, num_points=2048):
+    # random smooth curve through the unit cube
+    t = np.linspace(0, 1, num_points, dtype=np.float32)
+    freqs = rng.uniform(0.5, 2, 3)
+    phases = rng.uniform(0, 2 * np.pi, 3)
+    curve = 0.5 + 0.4 * np.sin(2 * np.pi * freqs * t[:, None] + phases).astype(np.float32)
+    pcl = curve + rng.normal(0, 0.01, curve.shape).astype(np.float32)
+
+    # labels come in runs along the curve like the segments of a wire
+    boundaries = np.sort(rng.integers(0, num_points, 2 * num_classes))
+    seg = (np.searchsorted(boundaries, np.arange(num_points), side="right") % num_classes).astype(np.uint8)
+
+    nodes = curve[np.linspace(0, num_points - 1, num_nodes).astype(np.int64)]
+    edges = np.stack([np.arange(num_nodes - 1), np.arange(1, num_nodes)], axis=1).astype(np.int32)
+    return pcl, seg, nodes, edges
+
+def write_synthetic(data, num_nodes=100, skeleton_format="edges", seed=0):
+    rng = np.random.default_rng(seed)
+    set_ids = data.get_train_split() + data.get_val_split() + data.get_test_split()
+    for set_id in set_ids:
+        for sample_id in range(data.get_samples_per_set()):
+            pcl, seg, nodes, edges = synthetic_sample(rng, data.get_num_classes(), num_nodes, data.get_num_points())
+            for kind, array in (("pcl", pcl), ("seg", seg)):
+                path = data.get_path(kind, set_id, sample_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                np.save(path, array)
+
+            path = data.get_skeleton_path(set_id, sample_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if skeleton_format == "adj":
+                adj = np.zeros((num_nodes, num_nodes), dtype=bool)
+                adj[edges[:, 0], edges[:, 1]] = True
+                np.savez_compressed(path, nodes=nodes, adj=adj)
+            else:
+                np.savez(path, nodes=nodes, edges=edges)
+    return set_ids
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Write a synthetic dataset in the layout of one of the dataset classes")
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("output_path")
+    parser.add_argument("--sets", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=None, help="samples per set, default is the one of the dataset")
+    parser.add_argument("--nodes", type=int, default=100, help="skeleton nodes per sample")
+    parser.add_argument("--skeleton-format", choices=["edges", "adj"], default="edges")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    data = synthetic_class(args.dataset, args.sets, args.samples)(args.output_path)
+    set_ids = write_synthetic(data, args.nodes, args.skeleton_format, args.seed)
+    print("Wrote {} sets with {} samples to '{}'".format(len(set_ids), data.get_samples_per_set(), args.output_path))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,92 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+"""
+Bone plan for create_armature_from_graph.py
+The traversal of the skeleton graph only needs numpy and scipy, so it is done here and can be tested outside of blender.
+The result is a list of (bone_name, parent_name, head_node, tail_node) in the order in which the bones have to be created.
+parent_name is None for bones without a connected parent.
+"""
+
+def load_graph(path):
+    graph = np.load(path)
+    nodes = graph['nodes']
+    if 'edges' in graph:
+        edges = graph['edges']
+    else:
+        adj = graph['adj']
+        edges = np.argwhere(np.triu(adj | adj.T))
+    return nodes, np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+def build_adjacency_lists(num_nodes, edges):
+    # every undirected edge gets an id, so it can be marked as used from both of its nodes
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    edge_ids = np.arange(len(edges))
+
+    self_loops = edges[:, 0] == edges[:, 1]
+    src = np.concatenate([edges[:, 0], edges[~self_loops, 1]])
+    dst = np.concatenate([edges[:, 1], edges[~self_loops, 0]])
+    ids = np.concatenate([edge_ids, edge_ids[~self_loops]])
+
+    # neighbours sorted by index, like np.where on a row of the dense adjacency matrix
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return indptr, dst[order], ids[order], len(edges)
+
+def get_closest_node(nodes, done, todo):
+    # the closest pair between the processed and the remaining nodes, found with a kd-tree over the remaining ones
+    dists, nearest = cKDTree(nodes[todo]).query(nodes[done])
+    closest = np.argmin(dists)
+    return done[closest], todo[nearest[closest]]
+
+def bone_name(node_id):
+    return "Bone.{:03d}".format(node_id)
+
+def plan_bones(nodes, edges, start_node):
+    nodes = np.asarray(nodes)
+    num_nodes = len(nodes)
+    indptr, neighbours, edge_ids, num_edges = build_adjacency_lists(num_nodes, edges)
+
+    visited = np.zeros(num_nodes, dtype=bool)
+    used_edges = np.zeros(num_edges, dtype=bool)
+    done_order = [start_node]
+    visited[start_node] = True
+
+    plan = []
+    open_list = [start_node]
+
+    while len(done_order) != num_nodes:
+        if len(open_list) == 0:
+            from_node, to_node = get_closest_node(nodes, np.array(done_order), np.flatnonzero(~visited))
+            from_node, to_node = int(from_node), int(to_node)
+            open_list = [to_node]
+            visited[to_node] = True
+            done_order.append(to_node)
+            plan.append((bone_name(to_node), bone_name(from_node) if from_node != start_node else None, from_node, to_node))
+
+        node_id = open_list.pop()
+
+        # outgoing edges are only traversed once
+        start, end = indptr[node_id], indptr[node_id + 1]
+        unused = ~used_edges[edge_ids[start:end]]
+        outgoing_nodes = neighbours[start:end][unused]
+        used_edges[edge_ids[start:end][unused]] = True
+
+        open_list += [int(n) for n in outgoing_nodes if not visited[n]]
+
+        parent = bone_name(node_id) if node_id != start_node else None
+        for child_id in outgoing_nodes:
+            child_id = int(child_id)
+            if node_id == child_id:
+                print("Warning - skipping edge from node {} to itself".format(node_id))
+                continue
+            if visited[child_id]:
+                print("Warning - graph contains a circle at node {}!".format(child_id))
+                plan.append(("Circle", parent, node_id, child_id))
+            else:
+                visited[child_id] = True
+                done_order.append(child_id)
+                plan.append((bone_name(child_id), parent, node_id, child_id))
+
+    return plan
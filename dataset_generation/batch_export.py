@@ -0,0 +1,109 @@
+import argparse
+import pathlib
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+"""
+Runs the blender export scripts headless over a folder of .blend files.
+Every (file, script) pair is one `blender --background` process, up to --workers of them run in parallel.
+A finished export leaves a marker file in the output folder of the sample, so an interrupted run can simply be restarted.
+
+Usage:
+python dataset_generation/batch_export.py /path/to/blend_files /path/to/output --frames 1 301 --workers 8
+"""
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent
+SCRIPTS = {
+    "pcls": "export_pcls.py",
+    "segmentation": "export_segmentation.py",
+    "skeleton": "export_skeleton.py",
+}
+
+def get_marker_path(output_path, sample, script, frame_start, frame_end):
+    return output_path / sample / ".{}_{}_{}.done".format(script, frame_start, frame_end)
+
+def run_export(blender, blend_file, script, output_path, frame_start, frame_end):
+    sample = blend_file.stem
+    log_path = output_path / sample / "logs" / "{}.log".format(script)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    command = [
+        blender, "--background", str(blend_file),
+        "--python-exit-code", "1",
+        "--python", str(SCRIPT_DIR / SCRIPTS[script]),
+        "--", str(output_path), str(frame_start), str(frame_end),
+    ]
+
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        result = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT)
+    duration = time.perf_counter() - start
+
+    if result.returncode == 0:
+        get_marker_path(output_path, sample, script, frame_start, frame_end).write_text("{:.1f}\n".format(duration))
+    return sample, script, result.returncode, duration, log_path
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run the blender export scripts over many .blend files in parallel")
+    parser.add_argument("blend_path", help="folder with the .blend files")
+    parser.add_argument("output_path")
+    parser.add_argument("--frames", nargs=2, type=int, default=[1, 11], metavar=("START", "END"), help="frame range, END is exclusive")
+    parser.add_argument("--workers", type=int, default=4, help="number of blender processes running in parallel")
+    parser.add_argument("--scripts", nargs="+", choices=list(SCRIPTS), default=list(SCRIPTS))
+    parser.add_argument("--blender", default="blender", help="path to the blender executable")
+    parser.add_argument("--force", action="store_true", help="also rerun finished exports")
+    args = parser.parse_args(argv[1:])
+
+    output_path = pathlib.Path(args.output_path).resolve()
+    frame_start, frame_end = args.frames
+    blend_files = sorted(pathlib.Path(args.blend_path).glob("*.blend"))
+
+    jobs = []
+    skipped = 0
+    for blend_file in blend_files:
+        for script in args.scripts:
+            if not args.force and get_marker_path(output_path, blend_file.stem, script, frame_start, frame_end).exists():
+                skipped += 1
+                continue
+            jobs.append((blend_file, script))
+
+    print("{} .blend files, {} exports to run, {} already done".format(len(blend_files), len(jobs), skipped))
+
+    timings = {script: [] for script in args.scripts}
+    failed = []
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(run_export, args.blender, blend_file, script, output_path, frame_start, frame_end) for blend_file, script in jobs]
+
+        for done, future in enumerate(as_completed(futures), 1):
+            sample, script, returncode, duration, log_path = future.result()
+            if returncode == 0:
+                timings[script].append(duration)
+                status = "ok"
+            else:
+                failed.append((sample, script, log_path))
+                status = "FAILED (see {})".format(log_path)
+
+            elapsed = time.perf_counter() - start
+            remaining = elapsed / done * (len(jobs) - done)
+            print("[{:4d}/{:4d}] {: <12} {: <20} {:7.1f}s  {}  (elapsed {:.0f}s, remaining ~{:.0f}s)".format(
+                done, len(jobs), script, sample, duration, status, elapsed, remaining))
+
+    print("\nTimings per export:")
+    for script, durations in timings.items():
+        if len(durations) > 0:
+            print("{: <12} {:4d} runs, mean {:7.1f}s, total {:8.1f}s, {:.2f}s per frame".format(
+                script, len(durations), sum(durations) / len(durations), sum(durations), sum(durations) / len(durations) / max(frame_end - frame_start, 1)))
+    print("Wall time: {:.1f}s".format(time.perf_counter() - start))
+
+    if len(failed) > 0:
+        print("\n{} exports failed:".format(len(failed)))
+        for sample, script, log_path in failed:
+            print("  {} {} ({})".format(sample, script, log_path))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv)
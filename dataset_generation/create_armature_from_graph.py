@@ -1,8 +1,7 @@
 import bpy
+import sys
 from pathlib import Path
-import numpy as np 
 from mathutils import Vector
-from scipy.spatial import distance_matrix
 
 """
 This file needs to be run inside of Blender
@@ -12,9 +11,14 @@ Run it again, but set the start node to one at the end of a wire - this will cre
 """
 
 ROOT = Path('path/to/data')
+# folder of this repository's dataset_generation scripts, the traversal of the graph is done in armature_plan.py
+SCRIPT_DIR = Path('path/to/cdlo-datasets/dataset_generation')
 FILE_INDEX = 0
 start_node = None
 
+sys.path.append(str(SCRIPT_DIR))
+from armature_plan import load_graph, plan_bones
+
 def empty_at(pos, index):
     o = bpy.data.objects.new( "empty.{:04d}".format(index), None )
     o.location = pos
@@ -22,18 +26,6 @@ def empty_at(pos, index):
     o.empty_display_type = 'PLAIN_AXES'   
     bpy.context.scene.collection.objects.link( o )
 
-def get_outgoing_nodes(adjacency, node_id):
-    outgoing_nodes = np.where(adjacency[node_id, :] == 1)[0]
-    adjacency[outgoing_nodes, node_id] = 0
-    adjacency[node_id, outgoing_nodes] = 0
-    
-    return outgoing_nodes
-
-def get_closest_node(nodes, done, todo):
-    dists = distance_matrix([nodes[v] for v in done],[nodes[v] for v in todo])
-    indices = np.unravel_index(np.argmin(dists), dists.shape)
-    return done[indices[0]], todo[indices[1]]
-
 # bpy.ops.object.mode_set(mode='OBJECT')
 
 bpy.ops.object.select_all()
@@ -41,12 +33,7 @@ bpy.ops.object.delete()
 bpy.ops.object.select_all()
 bpy.ops.object.delete()
 
-graph = np.load(ROOT / 'skeleton' / '{:03d}.npz'.format(FILE_INDEX))
-nodes = graph['nodes']
-adj = graph['adj']
-
-inds = np.where(adj == 1)
-adj[inds[1], inds[0]] = 1
+nodes, edges = load_graph(ROOT / 'skeleton' / '{:03d}.npz'.format(FILE_INDEX))
 
 if start_node is None:
     for n, node in enumerate(nodes):
@@ -63,42 +50,14 @@ else:
     for bone in armature.edit_bones:
         armature.edit_bones.remove(bone)
 
-    open_list = [start_node]
-    done_list = [start_node]
-
-    while len(done_list) != len(nodes):
-        if len(open_list) == 0:
-            from_node, to_node = get_closest_node(nodes, done_list, [i for i in range(len(nodes)) if i not in done_list])
-            open_list = [to_node]
-            eb = armature.edit_bones.new("Bone.{:03d}".format(to_node))
-            done_list.append(to_node)
-            eb.head = nodes[from_node]
-            eb.tail = nodes[to_node]
-            
-            eb.parent = armature.edit_bones["Bone.{:03d}".format(from_node)]
+    # the bones are created in the order of the precomputed plan, so every parent exists before its children
+    for name, parent, head_node, tail_node in plan_bones(nodes, edges, start_node):
+        eb = armature.edit_bones.new(name)
+        eb.head = nodes[head_node]
+        eb.tail = nodes[tail_node]
+        if parent is not None:
+            eb.parent = armature.edit_bones[parent]
             eb.use_connect = True
-
-        node_id = open_list.pop()
-        
-        outgoing_nodes = get_outgoing_nodes(adj, node_id)
-        
-        open_list += [n for n in outgoing_nodes if n not in done_list]
-        
-        for child_id in outgoing_nodes:
-            if node_id == child_id:
-                print("Warning - skipping edge from node {} to itself".format(node_id))
-                continue
-            if child_id in done_list:
-                print("Warning - graph contains a circle at node {}!".format(child_id))
-                eb = armature.edit_bones.new("Circle".format(child_id))
-            else:
-                eb = armature.edit_bones.new("Bone.{:03d}".format(child_id))
-                done_list.append(child_id)
-            eb.head = nodes[node_id]
-            eb.tail = nodes[child_id]
-            if node_id != start_node:
-                eb.parent = armature.edit_bones["Bone.{:03d}".format(node_id)]
-                eb.use_connect = True
                 
     bpy.ops.object.mode_set(mode='OBJECT')
     
@@ -4,18 +4,32 @@ import pathlib
 import sys
 
 OUTPUT_PATH = "/path/to/output"
+FRAME_START = 1
+FRAME_END = 11
 
-def vec2arr(vec):
-    return np.array([vec[0], vec[1], vec[2]])
+def parse_args(argv):
+    # arguments after '--' when run headless: blender --background file.blend --python export_pcls.py -- [output_path] [frame_start] [frame_end]
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    output_path = argv[0] if len(argv) > 0 else OUTPUT_PATH
+    frame_start = int(argv[1]) if len(argv) > 1 else FRAME_START
+    frame_end = int(argv[2]) if len(argv) > 2 else FRAME_END
+    return output_path, frame_start, frame_end
 
-def transform_pose(pose, R):
-    transformed = R @ pose
-    return vec2arr(transformed)
+def get_vertex_coords(obj):
+    # copy all vertex coordinates at once into a flat float32 buffer
+    vertices = obj.data.vertices
+    coords = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", coords)
+    return coords.reshape(-1, 3)
+
+def transform_coords(coords, R):
+    R = np.array(R, dtype=np.float32)
+    return coords @ R[:3, :3].T + R[:3, 3]
 
 def export_pcl(R, obj, output_file):
-    coords = np.array([transform_pose(v.co, R) for v in obj.data.vertices])
-    connector_coords = np.array([transform_pose(v.co, R) for v in bpy.data.objects["connector"].data.vertices]).reshape(-1,3)
-    outlier_coords = np.array([transform_pose(v.co, R) for v in bpy.data.objects["none"].data.vertices])
+    coords = transform_coords(get_vertex_coords(obj), R)
+    connector_coords = transform_coords(get_vertex_coords(bpy.data.objects["connector"]), R)
+    outlier_coords = transform_coords(get_vertex_coords(bpy.data.objects["none"]), R)
 
     pcl = np.r_[coords, connector_coords, outlier_coords]
 
@@ -23,14 +37,16 @@ def export_pcl(R, obj, output_file):
 
 if __name__ == "__main__":
     sample = pathlib.Path(bpy.context.blend_data.filepath).stem
+    output_path, frame_start, frame_end = parse_args(sys.argv)
 
-    output_path = pathlib.Path(OUTPUT_PATH) / sample
-    output_path.mkdir(exist_ok=True)
+    output_path = pathlib.Path(output_path) / sample
+    output_path.mkdir(exist_ok=True, parents=True)
 
     pcl_path = output_path / "pcl"
     pcl_path.mkdir(exist_ok=True)
 
-    for frame in range(1, 11):
+    num_frames = frame_end - frame_start
+    for frame in range(frame_start, frame_end):
 
         bpy.context.scene.frame_set(frame)
 
@@ -54,7 +70,7 @@ if __name__ == "__main__":
         
         # print progress
         sys.stdout.write('\r')
-        sys.stdout.write("[{: <70}] {:04d}/{:04d}".format('='*int(70*frame / 300), frame, 300))
+        sys.stdout.write("[{: <70}] {:04d}/{:04d}".format('='*int(70*(frame - frame_start + 1) / num_frames), frame - frame_start + 1, num_frames))
         sys.stdout.flush()
         
         export_pcl(R_o, main_ob, pcl_path / "{:03d}".format(frame - 1))
\ No newline at end of file
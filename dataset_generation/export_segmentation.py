@@ -1,22 +1,47 @@
 import bpy
 import numpy as np
 import pathlib
-
+import sys
+
+# the labeling itself is done in labeling.py, which also runs outside of blender on exported data
+# folder of this repository's dataset_generation scripts, needed when the script is run from blender's text editor
+SCRIPT_DIR = pathlib.Path('path/to/cdlo-datasets/dataset_generation')
+# run with blender --python, __file__ is the path of this script (in the text editor it is a path inside of the .blend file)
+if not (SCRIPT_DIR / "labeling.py").is_file() and (pathlib.Path(__file__).resolve().parent / "labeling.py").is_file():
+    SCRIPT_DIR = pathlib.Path(__file__).resolve().parent
+sys.path.append(str(SCRIPT_DIR))
+from labeling import BonePoses, LabelingParams, VertexGroupIndex, project_on_bone, segment_frame
+import labeling
 
 """
 This file needs to be run inside of blender
+When it is copied into the scripting section, set SCRIPT_DIR to the dataset_generation folder of this repository
 All noise points should be in a group 'none'
 All connector points should be in a group 'connectors'
-The bifurcation and endpoint segmentation is done automatically
+The bifurcation and endpoint segmentation is done automatically for every frame from FRAME_START to FRAME_END (exclusive)
 """
 
 OUTPUT_PATH = "/output/folder"
+FRAME_START = 1
+FRAME_END = 11
 
 BIFURCATION_LAMBDA = 0.1
 ENDPOINT_LAMBDA = 0.3
 THICKNESS_SCALING = 100
 UPPER_BOUND = 0.1
 LOWER_BOUND = 0.01
+PARAMS = LabelingParams(BIFURCATION_LAMBDA, ENDPOINT_LAMBDA, THICKNESS_SCALING, UPPER_BOUND, LOWER_BOUND)
+
+# cache the vertex group index next to the .blend file
+GROUP_INDEX_CACHE = True
+
+def parse_args(argv):
+    # arguments after '--' when run headless: blender --background file.blend --python export_segmentation.py -- [output_path] [frame_start] [frame_end]
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    output_path = argv[0] if len(argv) > 0 else OUTPUT_PATH
+    frame_start = int(argv[1]) if len(argv) > 1 else FRAME_START
+    frame_end = int(argv[2]) if len(argv) > 2 else FRAME_END
+    return output_path, frame_start, frame_end
 
 def vec2arr(vec):
     return np.array([vec[0], vec[1], vec[2]])
@@ -25,50 +50,35 @@ def transform_pose(pose, R):
     transformed = R @ pose
     return vec2arr(transformed)
 
-def estimate_bone_thickness(R_a, R_o, armature, ob, bone_id, group_lookup, connector_bones):
-    bone = armature.pose.bones[bone_id]
-
-    head_coord = vec2arr(R_a @ bone.head)
-    tail_coord = vec2arr(R_a @ bone.tail)
-
-    bone_direction = tail_coord - head_coord
-    bone_length = np.linalg.norm(bone_direction)
-    bone_direction_norm = bone_direction / bone_length
-
-    vert_dists = []
-    
-    t_min, t_max = 0, 0
-    
-    if bone_id in group_lookup and bone_id not in connector_bones:
-        for v_id in group_lookup[bone_id]:
-            v = ob.data.vertices[v_id]
-            
-            bone_coord = vec2arr(R_o @ v.co)
-            
-            t = np.dot(bone_coord - head_coord, bone_direction_norm)
-            if t < t_min:
-                t_min = t
-            if t > t_max:
-                t_max = t
-            
-            projected_point = head_coord + t * bone_direction_norm
-            
-            vert_dists.append(np.linalg.norm(bone_coord - projected_point))
-            
-        return vert_dists, bone_length, t_min, t_max
-    
-    else:
-        return [], bone_length, 0, 0
+def get_vertex_coords(obj, R):
+    # all vertices are transformed once per frame, the bone functions only index into this array
+    vertices = obj.data.vertices
+    coords = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", coords)
+    R = np.array(R)
+    return coords.reshape(-1, 3) @ R[:3, :3].T + R[:3, 3]
+
+def read_bone_poses(armature, R_a, bone_index):
+    # heads and tails are the only pose dependent quantities besides the vertex coordinates, so they are read in bulk once per frame
+    bones = armature.pose.bones
+    heads = np.empty(len(bones) * 3, dtype=np.float32)
+    tails = np.empty(len(bones) * 3, dtype=np.float32)
+    bones.foreach_get("head", heads)
+    bones.foreach_get("tail", tails)
+
+    R_a = np.array(R_a)
+    return BonePoses(heads.reshape(-1, 3) @ R_a[:3, :3].T + R_a[:3, 3], tails.reshape(-1, 3) @ R_a[:3, :3].T + R_a[:3, 3], bone_index)
+
+def build_segment_chains(armature, root_bone_id):
+    children = {bone.name: [child.name for child in bone.children] for bone in armature.pose.bones}
+    return labeling.build_segment_chains(children, root_bone_id)
 
 """
 Get the bone length using the assigned points to account for wrong labelling.
 """
-def get_bone_length(R_a, R_o, armature, ob, bone_id, group_lookup, connector_bones, include_t_min=False, include_t_max=False):
+def get_bone_length(poses, coords, bone_id, group_lookup, connector_bones, include_t_min=False, include_t_max=False):
     # print("GETTING {}".format(bone_id))
-    bone = armature.pose.bones[bone_id]
-
-    head_coord = vec2arr(R_a @ bone.head)
-    tail_coord = vec2arr(R_a @ bone.tail)
+    head_coord, tail_coord = poses.get(bone_id)
 
     bone_direction = tail_coord - head_coord
     bone_length = np.linalg.norm(bone_direction)
@@ -78,16 +88,8 @@ def get_bone_length(R_a, R_o, armature, ob, bone_id, group_lookup, connector_bon
     
     if include_t_min or include_t_max:
         if bone_id in group_lookup and bone_id not in connector_bones:
-            for v_id in group_lookup[bone_id]:
-                v = ob.data.vertices[v_id]
-                
-                bone_coord = vec2arr(R_o @ v.co)
-                
-                t = np.dot(bone_coord - head_coord, bone_direction_norm)
-                if t < t_min:
-                    t_min = t
-                if t > t_max:
-                    t_max = t
+            t, _ = project_on_bone(coords, group_lookup[bone_id], head_coord, bone_direction_norm)
+            t_min, t_max = min(t.min(), 0), max(t.max(), 0)
         else:
             print("WARNING: Bone {} not in group lookup".format(bone_id))
 
@@ -98,123 +100,10 @@ def get_bone_length(R_a, R_o, armature, ob, bone_id, group_lookup, connector_bon
 
     return head_coord + t_min * bone_direction_norm, head_coord + t_max * bone_direction_norm, t_max - t_min
 
-def segment_in_dir(R_a, R_o, armature, ob, start_bone, group_lookup, bone_lengths, seg_len, labels, label, is_start):
-    current_bone = start_bone
-    if is_start:
-        i = 0
-    else:
-        i = -1
-    
-    while seg_len > bone_lengths[i]:
-        if is_start and len(current_bone.children) != 1 or not is_start and current_bone.parent is None:
-            break
-        
-        if current_bone.name in group_lookup:
-            for v_id in group_lookup[current_bone.name]:
-                labels[v_id] = label
-        
-        seg_len -= bone_lengths[i]
-        if is_start:
-            current_bone = current_bone.children[0]
-            i += 1
-        else:
-            current_bone = current_bone.parent
-            i -= 1
-    
-    # segment only a part of the last bonehead_coord = vec2arr(R_a @ bone.head)
-    head_coord = vec2arr(R_a @ current_bone.head)
-    tail_coord = vec2arr(R_a @ current_bone.tail)
-
-    bone_direction = tail_coord - head_coord
-    bone_length = bone_lengths[i]
-    bone_direction_norm = bone_direction / bone_length
-    
-    if current_bone.name in group_lookup:
-        for v_id in group_lookup[current_bone.name]:
-            v = ob.data.vertices[v_id]
-            vertex_coord = vec2arr(R_o @ v.co)
-            t = np.dot(vertex_coord - head_coord, bone_direction_norm)
-            
-            if (is_start and t <= seg_len) or (not is_start and t > bone_length - seg_len):
-                labels[v_id] = label
-
-def thickness_fct(l, thickness):
-    beta = UPPER_BOUND - LOWER_BOUND
-    
-    return l * (2 * beta * (1 - 1 / (1 + np.exp(-THICKNESS_SCALING * thickness))) + LOWER_BOUND)
-
-def segment_from_bone(R_a, R_o, armature, ob, start_bone_id, is_end, group_lookup, labels, connector_bones):
-    vert_dists, bone_length, t_min, t_max = estimate_bone_thickness(R_a, R_o, armature, ob, start_bone_id, group_lookup, connector_bones)
-    
-    start_label = 2
-    start_lambda = BIFURCATION_LAMBDA
-    start_overhead = 0
-    
-    if is_end:
-        start_label = 1
-        start_lambda = ENDPOINT_LAMBDA
-        start_overhead = -t_min
-    else:
-        # print("Start intersection")
-        pass
-    
-    bone_lengths = [bone_length]
-    
-    start_bone = armature.pose.bones[start_bone_id]
-    current_bone = start_bone
-    
-    while len(current_bone.children) == 1:
-        current_bone = current_bone.children[0]
-        
-        current_dists, bone_length, t_min, t_max = estimate_bone_thickness(R_a, R_o, armature, ob, current_bone.name, group_lookup, connector_bones)
-        bone_lengths.append(bone_length)
-        
-        vert_dists += current_dists
-    
-    end_bone = current_bone
-    end_label = 2
-    end_lambda = BIFURCATION_LAMBDA
-    end_overhead = 0
-    
-    if len(current_bone.children) == 0:
-        end_label = 1
-        end_lambda = ENDPOINT_LAMBDA
-        end_overhead = t_max - bone_length
-    else:
-        # print("Found intersection")
-        pass
-    
-    segment_length = sum(bone_lengths) + start_overhead + end_overhead
-    print("From {} to {}: {}".format(start_bone_id, end_bone.name, segment_length))
-
-    thickness = np.mean(vert_dists) + 3 * np.std(vert_dists)
-    
-    start_length = thickness_fct(start_lambda, thickness)
-    end_length = thickness_fct(end_lambda, thickness)
-    
-    if start_label == 2:
-        start_length += bone_lengths[0]
-    if end_label == 2:
-        end_length += bone_lengths[-1]
-    
-    start_length = min(start_length, start_lambda / (start_lambda + end_lambda) * segment_length) - start_overhead
-    end_length = min(end_length, end_lambda / (start_lambda + end_lambda) * segment_length) - end_overhead
-    
-    print("Labeling start from bone {} length {} label {}".format(start_bone.name, start_length, start_label))
-    if start_bone.name not in connector_bones:
-        segment_in_dir(R_a, R_o, armature, ob, start_bone, group_lookup, bone_lengths, start_length, labels, start_label, is_start = True)
-    
-    print("Labeling end from bone {} length {} label {}".format(end_bone.name, end_length, end_label))
-    if end_bone.name not in connector_bones:
-        segment_in_dir(R_a, R_o, armature, ob, end_bone, group_lookup, bone_lengths, end_length, labels, end_label, is_start = False)
-    
-    for child in end_bone.children:
-        segment_from_bone(R_a, R_o, armature, ob, child.name, False, group_lookup, labels, connector_bones)
-
 def child_bones_wo_connectors(bone, connector_bones):
     return [c for c in bone.children if c.name not in connector_bones]
 
-def get_segment_lengths(R_a, R_o, armature, ob, start_bone_id, group_lookup, connector_bones, is_start=True):
+def get_segment_lengths(poses, coords, armature, start_bone_id, group_lookup, connector_bones, is_start=True):
 
     current_seg = []
     current_seg_len = 0
@@ -222,7 +111,7 @@ def get_segment_lengths(R_a, R_o, armature, ob, start_bone_id, group_lookup, con
     current_bone = armature.pose.bones[start_bone_id]
 
     while len(child_bones_wo_connectors(current_bone, connector_bones)) == 1:
-        head, tail, bone_len = get_bone_length(R_a, R_o, armature, ob, current_bone.name, group_lookup, connector_bones, include_t_min=is_start)
+        head, tail, bone_len = get_bone_length(poses, coords, current_bone.name, group_lookup, connector_bones, include_t_min=is_start)
 
         current_seg.append(head)
         current_seg_len += bone_len
@@ -232,7 +121,7 @@ def get_segment_lengths(R_a, R_o, armature, ob, start_bone_id, group_lookup, con
         is_start = False
     
     is_end_bone = len(child_bones_wo_connectors(current_bone, connector_bones)) == 0
-    head, tail, bone_len = get_bone_length(R_a, R_o, armature, ob, current_bone.name, group_lookup, connector_bones, include_t_min=is_start, include_t_max=is_end_bone)
+    head, tail, bone_len = get_bone_length(poses, coords, current_bone.name, group_lookup, connector_bones, include_t_min=is_start, include_t_max=is_end_bone)
 
     current_seg.append(head)
     current_seg.append(tail)
@@ -242,7 +131,7 @@ def get_segment_lengths(R_a, R_o, armature, ob, start_bone_id, group_lookup, con
     segment_lengths = [current_seg_len]
 
     for child in child_bones_wo_connectors(current_bone, connector_bones):
-        child_segments, child_segment_lengths = get_segment_lengths(R_a, R_o, armature, ob, child.name, group_lookup, connector_bones, is_start=False)
+        child_segments, child_segment_lengths = get_segment_lengths(poses, coords, armature, child.name, group_lookup, connector_bones, is_start=False)
         
         segments += child_segments
         segment_lengths += child_segment_lengths
@@ -250,14 +139,7 @@ def get_segment_lengths(R_a, R_o, armature, ob, start_bone_id, group_lookup, con
     return segments, segment_lengths
 
 def get_connector_bones(bones, ob):
-    cb = set()
-    for v_id, v in enumerate(ob.data.vertices):
-        for g in v.groups:
-            if g.group < len(ob.vertex_groups):
-                bone_name = ob.vertex_groups[g.group].name
-                cb.add(bone_name)
-
-    return cb
+    return set(build_group_lookup(ob).group_names())
 
 def filter_connector_bones(connector_bones):
     def is_bone_valid(bone_id):
@@ -269,15 +151,22 @@ def filter_connector_bones(connector_bones):
     return [b for b in connector_bones if is_bone_valid(b)]
 
 def build_group_lookup(obj):
-    group_lookup = {}
-    for v_id, v in enumerate(obj.data.vertices):
-        for g in v.groups:
-            if g.group < len(obj.vertex_groups):
-                group_name = obj.vertex_groups[g.group].name
-                # print(group_name)
-                if group_name not in group_lookup:
-                    group_lookup[group_name] = []
-                group_lookup[group_name].append(v_id)
+    # the index is cached next to the .blend file and rebuilt when the file or the vertex count changes
+    # with unsaved changes (e.g. edited 'none' or connector groups) the saved file does not match the scene, so the cache is skipped
+    blend_file = pathlib.Path(bpy.data.filepath) if bpy.data.filepath else None
+    if not GROUP_INDEX_CACHE or blend_file is None or bpy.data.is_dirty:
+        return VertexGroupIndex.from_object(obj)
+
+    cache_file = blend_file.with_name("{}.{}.groups.npz".format(blend_file.stem, obj.name))
+    blend_mtime = blend_file.stat().st_mtime_ns
+    if cache_file.exists():
+        with np.load(cache_file) as data:
+            is_valid = data["blend_mtime"] == blend_mtime and data["num_vertices"] == len(obj.data.vertices)
+        if is_valid:
+            return VertexGroupIndex.load(cache_file)
+
+    group_lookup = VertexGroupIndex.from_object(obj)
+    group_lookup.save(cache_file, blend_mtime=blend_mtime, num_vertices=len(obj.data.vertices))
     return group_lookup
 
 def export_labels(R, obj, labels, reserved_counts, output_file):
@@ -289,12 +178,12 @@ def export_labels(R, obj, labels, reserved_counts, output_file):
 
 if __name__ == "__main__":
     sample = pathlib.Path(bpy.context.blend_data.filepath).stem
+    output_path, frame_start, frame_end = parse_args(sys.argv)
 
-    output_path = pathlib.Path(OUTPUT_PATH)
-    output_path.mkdir(exist_ok=True)
+    output_path = pathlib.Path(output_path)
+    output_path.mkdir(exist_ok=True, parents=True)
 
     armature = bpy.data.objects["Armature"]
-    R_a = armature.matrix_world
 
     reserved_obs = ["connector", "none"]
     reserved_names = [[],[]]
@@ -320,12 +209,6 @@ if __name__ == "__main__":
     
     connector_bones = filter_connector_bones(connector_bones)
 
-    bpy.context.view_layer.objects.active = main_ob
-    bpy.data.objects[main_ob.name].select_set(True)
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    main_ob = bpy.context.active_object.evaluated_get(depsgraph)
-    R_o = main_ob.matrix_world
-
     bone_id = None
     for bone in armature.pose.bones:
         if bone.parent == None:
@@ -333,11 +216,36 @@ if __name__ == "__main__":
                 bone_id = bone.name
             else:
                 print("Object has two parent bones!")
-                exit()
+                sys.exit(1)
 
+    # everything that does not depend on the pose is computed once per file
     group_lookup = build_group_lookup(main_ob)
+    chains = build_segment_chains(armature, bone_id)
+    bone_index = {bone.name: i for i, bone in enumerate(armature.pose.bones)}
+
+    segmentation_path = output_path / sample / "segmentation"
+    segmentation_path.mkdir(exist_ok=True, parents=True)
+
+    bpy.context.view_layer.objects.active = main_ob
+    bpy.data.objects[main_ob.name].select_set(True)
+
+    num_frames = frame_end - frame_start
+    for frame in range(frame_start, frame_end):
+
+        bpy.context.scene.frame_set(frame)
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        eval_ob = main_ob.evaluated_get(depsgraph)
+        R_o = eval_ob.matrix_world
+
+        # print progress
+        sys.stdout.write('\r')
+        sys.stdout.write("[{: <70}] {:04d}/{:04d}".format('='*int(70*(frame - frame_start + 1) / num_frames), frame - frame_start + 1, num_frames))
+        sys.stdout.flush()
+
+        coords = get_vertex_coords(eval_ob, R_o)
+        poses = read_bone_poses(armature, armature.matrix_world, bone_index)
 
-    labels = np.zeros(len(main_ob.data.vertices), dtype=int)
-    segment_from_bone(R_a, R_o, armature, main_ob, bone_id, True, group_lookup, labels, connector_bones)
+        labels = segment_frame(poses, coords, chains, group_lookup, connector_bones, PARAMS, verbose=True)
 
-    export_labels(R_o, main_ob, labels, reserved_counts, output_path / sample / "segmentation.npy")
+        export_labels(R_o, eval_ob, labels, reserved_counts, segmentation_path / "{:03d}".format(frame - 1))
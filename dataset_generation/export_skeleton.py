@@ -4,66 +4,85 @@ import pathlib
 import sys
 
 OUTPUT_PATH = "/output/path"
+FRAME_START = 1
+FRAME_END = 11
 
-def vec2arr(vec):
-    return np.array([vec[0], vec[1], vec[2]])
-
-def transform_pose(pose, R):
-    transformed = R @ pose
-    return vec2arr(transformed)
-
-def extract_skeleton(R_a, current_bone, current_bone_id, coords, adjacency, return_next_bone_id=False):
-    if current_bone_id == 0:
-        coords[0] = transform_pose(current_bone.head, R_a)
-        adjacency[0,1] = 1
-        adjacency[1,0] = 1
-        current_bone_id += 1
-    
-    coords[current_bone_id] = transform_pose(current_bone.tail, R_a)
-    
-    next_bone_id = current_bone_id + 1
-    for child in current_bone.children:
-        adjacency[current_bone_id, next_bone_id] = 1
-        adjacency[next_bone_id, current_bone_id] = 1
-        next_bone_id = extract_skeleton(R_a, child, next_bone_id, coords, adjacency, return_next_bone_id=True)
-
-    if return_next_bone_id:
-        return next_bone_id
+def parse_args(argv):
+    # arguments after '--' when run headless: blender --background file.blend --python export_skeleton.py -- [output_path] [frame_start] [frame_end]
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    output_path = argv[0] if len(argv) > 0 else OUTPUT_PATH
+    frame_start = int(argv[1]) if len(argv) > 1 else FRAME_START
+    frame_end = int(argv[2]) if len(argv) > 2 else FRAME_END
+    return output_path, frame_start, frame_end
+
+def build_skeleton_order(armature, root_bone_id):
+    # node 0 is the head of the root bone, node k the tail of the k-th bone in depth first order
+    # the order and the edges only depend on the bone tree, so they are computed once per file
+    bones = armature.pose.bones
+    bone_index = {bone.name: i for i, bone in enumerate(bones)}
+
+    order = []
+    edges = []
+    todo = [(bones[root_bone_id], 0)]
+    while todo:
+        bone, parent_node = todo.pop()
+        node_id = len(order) + 1
+        order.append(bone_index[bone.name])
+        edges.append((parent_node, node_id))
+        todo += [(child, node_id) for child in reversed(bone.children)]
+
+    return np.array(order, dtype=np.int64), np.array(edges, dtype=np.int32)
+
+def extract_skeleton(R_a, armature, order):
+    # read all heads and tails at once and transform them with one matrix multiply
+    bones = armature.pose.bones
+    heads = np.empty(len(bones) * 3, dtype=np.float32)
+    tails = np.empty(len(bones) * 3, dtype=np.float32)
+    bones.foreach_get("head", heads)
+    bones.foreach_get("tail", tails)
+
+    R_a = np.array(R_a, dtype=np.float32)
+    coords = np.empty((len(order) + 1, 3), dtype=np.float32)
+    coords[0] = heads.reshape(-1, 3)[order[0]]
+    coords[1:] = tails.reshape(-1, 3)[order]
+    return coords @ R_a[:3, :3].T + R_a[:3, 3]
 
 if __name__ == "__main__":
     sample = pathlib.Path(bpy.context.blend_data.filepath).stem
+    output_path, frame_start, frame_end = parse_args(sys.argv)
 
-    output_path = pathlib.Path(OUTPUT_PATH)
-    output_path.mkdir(exist_ok=True)
+    output_path = pathlib.Path(output_path)
+    output_path.mkdir(exist_ok=True, parents=True)
 
     skeleton_path = output_path / sample / "skeletons"
     skeleton_path.mkdir(exist_ok=True, parents=True)
 
-    for frame in range(1, 11):
+    num_frames = frame_end - frame_start
+    armature = bpy.data.objects["Armature"]
+
+    bone_id = None
+    for bone in armature.pose.bones:
+        if bone.parent == None:
+            if bone_id == None:
+                bone_id = bone.name
+            else:
+                print("Object has two parent bones!")
+                sys.exit(1)
+
+    order, edges = build_skeleton_order(armature, bone_id)
+
+    for frame in range(frame_start, frame_end):
 
         bpy.context.scene.frame_set(frame)
 
-        armature = bpy.data.objects["Armature"]
         R_a = armature.matrix_world
-
-        bone_id = None
-        for bone in armature.pose.bones:
-            if bone.parent == None:
-                if bone_id == None:
-                    bone_id = bone.name
-                else:
-                    print("Object has two parent bones!")
-                    exit()
         
         # print progress
         sys.stdout.write('\r')
-        sys.stdout.write("[{: <70}] {:04d}/{:04d}".format('='*int(70*frame / 300), frame, 300))
+        sys.stdout.write("[{: <70}] {:04d}/{:04d}".format('='*int(70*(frame - frame_start + 1) / num_frames), frame - frame_start + 1, num_frames))
         sys.stdout.flush()
 
-        num_bones = len(armature.pose.bones)
-        adj = np.zeros((num_bones+1, num_bones+1), dtype=bool)
-        coords = np.zeros((num_bones+1, 3))
-
-        extract_skeleton(R_a, armature.pose.bones[bone_id], 0, coords, adj)
+        coords = extract_skeleton(R_a, armature, order)
 
-        np.savez(skeleton_path / "{:03d}.npz".format(frame), nodes=coords, adj=adj)
\ No newline at end of file
+        # the skeleton is stored as int32 edge list instead of a dense (num_bones+1)^2 adjacency matrix
+        np.savez(skeleton_path / "{:03d}.npz".format(frame), nodes=coords, edges=edges)
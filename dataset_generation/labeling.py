@@ -0,0 +1,447 @@
+import argparse
+import collections
+import pathlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+"""
+Endpoint and bifurcation labeling without blender
+The labeling of export_segmentation.py only needs the bone heads and tails, the vertex coordinates and the vertices of every bone.
+The algorithm is implemented here on plain arrays, export_segmentation.py uses it with the posed armature inside of blender
+and label_sample uses it on exported data: the bones are the edges of the skeleton (oriented away from a root node)
+and every point is assigned to its closest bone.
+
+Relabel a whole dataset with other parameters, e.g. for a parameter sweep:
+python dataset_generation/labeling.py wire /path/to/pointwire /path/to/output --endpoint-lambda 0.4 --workers 8
+The labels are written in the layout of the dataset to the output folder, the original files are not changed.
+Points with the labels given by --keep-labels (connector and noise points) keep their label.
+"""
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent
+
+LabelingParams = collections.namedtuple("LabelingParams", [
+    "bifurcation_lambda", "endpoint_lambda", "thickness_scaling", "upper_bound", "lower_bound", "endpoint_label", "bifurcation_label"],
+    defaults=[0.1, 0.3, 100, 0.1, 0.01, 1, 2])
+DEFAULT_PARAMS = LabelingParams()
+
+# a chain of bones between two endpoints or bifurcations, labelled as one segment
+SegmentChain = collections.namedtuple("SegmentChain", ["bones", "start_is_end", "end_is_end"])
+
+class BonePoses:
+    """
+    Heads and tails of all bones in world coordinates. bone_index maps bone ids (e.g. names) to rows, without it the ids are the rows.
+    """
+
+    def __init__(self, heads, tails, bone_index=None):
+        self.heads = heads
+        self.tails = tails
+        self.bone_index = bone_index
+
+    def get(self, bone_id):
+        i = self.bone_index[bone_id] if self.bone_index is not None else bone_id
+        return self.heads[i], self.tails[i]
+
+class VertexGroupIndex:
+    """
+    CSR index of the vertex group membership: the vertices of group g are vertices[offsets[g]:offsets[g + 1]].
+    It behaves like the old dict of lists, 'name in index' and 'index[name]' are O(1) and return an int32 index array.
+    """
+
+    def __init__(self, names, offsets, vertices):
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.vertices = np.asarray(vertices, dtype=np.int32)
+        self._lookup = {name: g for g, name in enumerate(self.names)}
+
+    @classmethod
+    def from_object(cls, obj):
+        names = [g.name for g in obj.vertex_groups]
+
+        # one pass over the vertices collects flat (group, vertex) pairs, the grouping is done by numpy
+        pairs = np.array([(g.group, v_id) for v_id, v in enumerate(obj.data.vertices) for g in v.groups], dtype=np.int64).reshape(-1, 2)
+        pairs = pairs[pairs[:, 0] < len(names)]
+        pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs[:, 0], minlength=len(names)), out=offsets[1:])
+        return cls(names, offsets, pairs[:, 1])
+
+    @classmethod
+    def from_assignment(cls, assignment, num_groups):
+        # every point belongs to at most one group, -1 for none
+        assignment = np.asarray(assignment, dtype=np.int64)
+        points = np.flatnonzero(assignment >= 0)
+        points = points[np.argsort(assignment[points], kind="stable")]
+
+        offsets = np.zeros(num_groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment[points], minlength=num_groups), out=offsets[1:])
+        return cls(range(num_groups), offsets, points)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["names"], data["offsets"], data["vertices"])
+
+    def save(self, path, **extra):
+        np.savez(path, names=np.array(self.names, dtype=str), offsets=self.offsets, vertices=self.vertices, **extra)
+
+    def __contains__(self, name):
+        g = self._lookup.get(name)
+        return g is not None and self.offsets[g + 1] > self.offsets[g]
+
+    def __getitem__(self, name):
+        g = self._lookup[name]
+        return self.vertices[self.offsets[g]:self.offsets[g + 1]]
+
+    def group_names(self):
+        return [name for g, name in enumerate(self.names) if self.offsets[g + 1] > self.offsets[g]]
+
+def project_on_bone(coords, v_ids, head_coord, bone_direction_norm):
+    rel_coords = coords[v_ids] - head_coord
+    return rel_coords @ bone_direction_norm, rel_coords
+
+def build_segment_chains(children, root_bone_id, start_is_end=True):
+    # children maps every bone to the list of its child bones
+    # the chains only depend on the bone tree, so they are computed once per file
+    # they are ordered depth first, as later chains overwrite the labels of earlier ones
+    chains = []
+    todo = [(root_bone_id, start_is_end)]
+    while todo:
+        start_bone_id, start_is_end = todo.pop()
+
+        current_bone = start_bone_id
+        bones = [current_bone]
+        while len(children[current_bone]) == 1:
+            current_bone = children[current_bone][0]
+            bones.append(current_bone)
+
+        chains.append(SegmentChain(bones, start_is_end, len(children[current_bone]) == 0))
+        todo += [(child, False) for child in reversed(children[current_bone])]
+    return chains
+
+def estimate_bone_thickness(poses, coords, bone_id, group_lookup, connector_bones):
+    head_coord, tail_coord = poses.get(bone_id)
+
+    bone_direction = tail_coord - head_coord
+    bone_length = np.linalg.norm(bone_direction)
+    bone_direction_norm = bone_direction / bone_length
+
+    if bone_id in group_lookup and bone_id not in connector_bones:
+        t, rel_coords = project_on_bone(coords, group_lookup[bone_id], head_coord, bone_direction_norm)
+
+        # distance of every vertex to its projection on the bone axis
+        vert_dists = np.linalg.norm(rel_coords - t[:, None] * bone_direction_norm, axis=1)
+
+        return vert_dists, bone_length, min(t.min(), 0), max(t.max(), 0)
+
+    else:
+        return np.empty(0), bone_length, 0, 0
+
+def segment_in_dir(poses, coords, chain, group_lookup, bone_lengths, seg_len, labels, label, is_start):
+    if is_start:
+        i = 0
+    else:
+        i = -1
+
+    while seg_len > bone_lengths[i]:
+        if is_start and i == len(chain.bones) - 1 or not is_start and i == -len(chain.bones):
+            break
+
+        if chain.bones[i] in group_lookup:
+            labels[group_lookup[chain.bones[i]]] = label
+
+        seg_len -= bone_lengths[i]
+        if is_start:
+            i += 1
+        else:
+            i -= 1
+
+    # segment only a part of the last bone
+    bone_id = chain.bones[i]
+    head_coord, tail_coord = poses.get(bone_id)
+
+    bone_direction = tail_coord - head_coord
+    bone_length = bone_lengths[i]
+    bone_direction_norm = bone_direction / bone_length
+
+    if bone_id in group_lookup:
+        v_ids = group_lookup[bone_id]
+        t, _ = project_on_bone(coords, v_ids, head_coord, bone_direction_norm)
+
+        if is_start:
+            labels[v_ids[t <= seg_len]] = label
+        else:
+            labels[v_ids[t > bone_length - seg_len]] = label
+
+def thickness_fct(l, thickness, params=DEFAULT_PARAMS):
+    beta = params.upper_bound - params.lower_bound
+
+    return l * (2 * beta * (1 - 1 / (1 + np.exp(-params.thickness_scaling * thickness))) + params.lower_bound)
+
+def segment_chain(poses, coords, chain, group_lookup, labels, connector_bones, params=DEFAULT_PARAMS, verbose=False):
+    vert_dists = []
+    bone_lengths = []
+
+    for i, bone_id in enumerate(chain.bones):
+        current_dists, bone_length, t_min, t_max = estimate_bone_thickness(poses, coords, bone_id, group_lookup, connector_bones)
+        if i == 0:
+            start_t_min = t_min
+        bone_lengths.append(bone_length)
+
+        vert_dists.append(current_dists)
+
+    start_label = params.bifurcation_label
+    start_lambda = params.bifurcation_lambda
+    start_overhead = 0
+
+    if chain.start_is_end:
+        start_label = params.endpoint_label
+        start_lambda = params.endpoint_lambda
+        start_overhead = -start_t_min
+
+    end_label = params.bifurcation_label
+    end_lambda = params.bifurcation_lambda
+    end_overhead = 0
+
+    if chain.end_is_end:
+        end_label = params.endpoint_label
+        end_lambda = params.endpoint_lambda
+        end_overhead = t_max - bone_length
+
+    start_bone_id = chain.bones[0]
+    end_bone_id = chain.bones[-1]
+
+    segment_length = sum(bone_lengths) + start_overhead + end_overhead
+    if verbose:
+        print("From {} to {}: {}".format(start_bone_id, end_bone_id, segment_length))
+
+    vert_dists = np.concatenate(vert_dists)
+    if len(vert_dists) == 0:
+        # without vertices the thickness is undefined and nothing would be labelled
+        return
+
+    thickness = np.mean(vert_dists) + 3 * np.std(vert_dists)
+
+    start_length = thickness_fct(start_lambda, thickness, params)
+    end_length = thickness_fct(end_lambda, thickness, params)
+
+    if not chain.start_is_end:
+        start_length += bone_lengths[0]
+    if not chain.end_is_end:
+        end_length += bone_lengths[-1]
+
+    start_length = min(start_length, start_lambda / (start_lambda + end_lambda) * segment_length) - start_overhead
+    end_length = min(end_length, end_lambda / (start_lambda + end_lambda) * segment_length) - end_overhead
+
+    if verbose:
+        print("Labeling start from bone {} length {} label {}".format(start_bone_id, start_length, start_label))
+    if start_bone_id not in connector_bones:
+        segment_in_dir(poses, coords, chain, group_lookup, bone_lengths, start_length, labels, start_label, is_start = True)
+
+    if verbose:
+        print("Labeling end from bone {} length {} label {}".format(end_bone_id, end_length, end_label))
+    if end_bone_id not in connector_bones:
+        segment_in_dir(poses, coords, chain, group_lookup, bone_lengths, end_length, labels, end_label, is_start = False)
+
+def segment_frame(poses, coords, chains, group_lookup, connector_bones, params=DEFAULT_PARAMS, verbose=False):
+    labels = np.zeros(len(coords), dtype=int)
+    for chain in chains:
+        segment_chain(poses, coords, chain, group_lookup, labels, connector_bones, params, verbose)
+    return labels
+
+def orient_edges(num_nodes, edges, root=None):
+    """
+    Turns the undirected skeleton edges into bones pointing away from a root node.
+    Returns the head and tail node of every edge (-1 for edges that close a cycle) and the root nodes, one per connected component.
+    Without a given root, node 0 is used if it is an endpoint, otherwise the first endpoint.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    neighbours = [[] for _ in range(num_nodes)]
+    for e, (a, b) in enumerate(edges):
+        if a != b:
+            neighbours[a].append((b, e))
+            neighbours[b].append((a, e))
+
+    degree = np.array([len(n) for n in neighbours], dtype=np.int64)
+    endpoints = np.flatnonzero(degree == 1).tolist()
+    candidates = [root] if root is not None else []
+    candidates += ([0] if num_nodes > 0 and degree[0] == 1 else []) + endpoints + list(range(num_nodes))
+
+    heads = np.full(len(edges), -1, dtype=np.int64)
+    tails = np.full(len(edges), -1, dtype=np.int64)
+    used = np.zeros(len(edges), dtype=bool)
+    visited = np.zeros(num_nodes, dtype=bool)
+    roots = []
+
+    for start in candidates:
+        if visited[start] or degree[start] == 0:
+            continue
+        roots.append(start)
+        visited[start] = True
+        todo = [start]
+        while todo:
+            node = todo.pop()
+            for neighbour, e in neighbours[node]:
+                if used[e]:
+                    continue
+                used[e] = True
+                if visited[neighbour]:
+                    # the edge closes a cycle and is not part of the bone tree
+                    continue
+                visited[neighbour] = True
+                heads[e], tails[e] = node, neighbour
+                todo.append(neighbour)
+
+    return heads, tails, roots
+
+def get_bone_children(heads, tails):
+    # children of a bone are the bones starting at its tail, in the order of the edges
+    starting_at = collections.defaultdict(list)
+    for e in np.flatnonzero(heads >= 0):
+        starting_at[int(heads[e])].append(int(e))
+    return {int(e): starting_at[int(tails[e])] for e in np.flatnonzero(heads >= 0)}, starting_at
+
+def assign_to_bones(coords, head_coords, tail_coords):
+    # index of the closest bone (line segment) of every point
+    direction = tail_coords - head_coords
+    rel = coords[:, None, :] - head_coords[None, :, :]
+    t = np.einsum("nbd,bd->nb", rel, direction) / np.maximum(np.einsum("bd,bd->b", direction, direction), 1e-12)
+    closest = rel - np.clip(t, 0, 1)[:, :, None] * direction[None, :, :]
+    return np.argmin(np.einsum("nbd,nbd->nb", closest, closest), axis=1)
+
+def find_connector_bones(children, root_bones, group_lookup, is_connector):
+    # bones whose points are all connector points and whose child bones are connector bones as well
+    order = []
+    todo = list(root_bones)
+    while todo:
+        bone = todo.pop()
+        order.append(bone)
+        todo += children[bone]
+
+    connector_bones = set()
+    for bone in reversed(order):
+        points = group_lookup[bone] if bone in group_lookup else np.empty(0, dtype=np.int64)
+        if len(points) > 0 and is_connector[points].all() and all(c in connector_bones for c in children[bone]):
+            connector_bones.add(bone)
+    return connector_bones
+
+def label_sample(coords, nodes, edges, seg=None, keep_labels=(), connector_label=None, params=DEFAULT_PARAMS, root=None, assignment=None):
+    """
+    Labels endpoints and bifurcations of one exported sample.
+    coords are the points, nodes and edges the skeleton. Points whose label in seg is in keep_labels keep it
+    and are not used for the thickness estimation. Bones that only hold points with connector_label are treated as connector bones.
+    assignment is the bone (edge index) of every point, by default the closest one.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    nodes = np.asarray(nodes, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+    heads, tails, roots = orient_edges(len(nodes), edges, root)
+    bones = np.flatnonzero(heads >= 0)
+    poses = BonePoses(np.where(heads[:, None] >= 0, nodes[heads], 0), np.where(tails[:, None] >= 0, nodes[tails], 0))
+    children, starting_at = get_bone_children(heads, tails)
+
+    if assignment is None:
+        assignment = np.full(len(coords), -1, dtype=np.int64)
+        if len(bones) > 0:
+            assignment = bones[assign_to_bones(coords, poses.heads[bones], poses.tails[bones])]
+
+    root_bones = [bone for root_node in roots for bone in starting_at[root_node]]
+    kept = np.isin(seg, keep_labels) if seg is not None else np.zeros(len(coords), dtype=bool)
+    connector_bones = set()
+    if seg is not None and connector_label is not None:
+        all_points = VertexGroupIndex.from_assignment(assignment, len(edges))
+        connector_bones = find_connector_bones(children, root_bones, all_points, np.asarray(seg) == connector_label)
+
+    group_lookup = VertexGroupIndex.from_assignment(np.where(kept, -1, assignment), len(edges))
+
+    chains = []
+    for root_node in roots:
+        # a root with a single bone is an endpoint, otherwise all its bones start at a bifurcation
+        root_bones = starting_at[root_node]
+        for root_bone in root_bones:
+            chains += build_segment_chains(children, root_bone, start_is_end=len(root_bones) == 1)
+
+    labels = segment_frame(poses, coords, chains, group_lookup, connector_bones, params)
+    if seg is not None:
+        labels[kept] = np.asarray(seg)[kept]
+    return labels
+
+def relabel_set(job):
+    dataset, data_path, output_path, set_id, keep_labels, connector_label, params = job
+    sys.path.append(str(SCRIPT_DIR.parent))
+    from dataloading.datasets import get_dataset
+    from dataloading.distances import skeleton_distances
+
+    data = get_dataset(dataset, data_path)
+    output = get_dataset(dataset, output_path)
+    num_classes = data.get_num_classes()
+
+    changed = 0
+    counts = np.zeros(num_classes, dtype=np.int64)
+    for sample_id in range(data.get_samples_per_set()):
+        seg = data.load_seg(set_id, sample_id)
+        pcl = data.load_pcl(set_id, sample_id)
+        skeleton = data.load_skeleton(set_id, sample_id, sparse=True)
+
+        # the closest edges are read from the precomputed sidecar if it exists (python -m dataloading.distances)
+        if skeleton.nearest_edge is not None:
+            assignment = skeleton.nearest_edge
+        else:
+            assignment = skeleton_distances(pcl, skeleton)[0]
+        labels = label_sample(pcl, skeleton.nodes, skeleton.edges, seg, keep_labels, connector_label, params, assignment=assignment)
+
+        seg_path = pathlib.Path(output.get_seg_path(set_id, sample_id))
+        seg_path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(seg_path, labels.astype(seg.dtype))
+
+        changed += int(np.count_nonzero(labels != seg))
+        counts += np.bincount(labels, minlength=num_classes)[:num_classes]
+    return set_id, changed, counts
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Relabel the endpoints and bifurcations of an exported dataset")
+    parser.add_argument("dataset", choices=["wire", "vessel"])
+    parser.add_argument("data_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--sets", nargs="+", type=int, default=None, help="set ids, default are all sets of the dataset")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keep-labels", nargs="*", type=int, default=None, help="labels that are not changed, default are all above the bifurcation label")
+    parser.add_argument("--connector-label", type=int, default=None)
+    for name, default in DEFAULT_PARAMS._asdict().items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(default), default=default)
+    args = parser.parse_args(argv[1:])
+
+    sys.path.append(str(SCRIPT_DIR.parent))
+    from dataloading.datasets import get_dataset
+
+    data = get_dataset(args.dataset, args.data_path)
+    params = LabelingParams(**{name: getattr(args, name) for name in LabelingParams._fields})
+    num_classes = data.get_num_classes()
+    if max(params.endpoint_label, params.bifurcation_label) >= num_classes:
+        parser.error("the dataset has only {} classes, set --endpoint-label and --bifurcation-label".format(num_classes))
+
+    keep_labels = args.keep_labels
+    if keep_labels is None:
+        keep_labels = list(range(max(params.endpoint_label, params.bifurcation_label) + 1, num_classes))
+    set_ids = args.sets if args.sets is not None else data.get_train_split() + data.get_val_split() + data.get_test_split()
+
+    print("Relabeling {} sets with {}".format(len(set_ids), params))
+    jobs = [(args.dataset, args.data_path, args.output_path, set_id, keep_labels, args.connector_label, params) for set_id in set_ids]
+
+    start = time.perf_counter()
+    changed = 0
+    counts = np.zeros(num_classes, dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for set_id, set_changed, set_counts in executor.map(relabel_set, jobs):
+            changed += set_changed
+            counts += set_counts
+            print("Set {}: {} labels changed".format(set_id, set_changed))
+
+    print("Done in {:.1f}s, {:.2f}% of the labels changed".format(time.perf_counter() - start, 100 * changed / max(counts.sum(), 1)))
+    print("Class distribution:", " ".join("{:5.1f}%".format(100 * c / max(counts.sum(), 1)) for c in counts))
+
+if __name__ == "__main__":
+    main(sys.argv)
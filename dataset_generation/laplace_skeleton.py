@@ -2,23 +2,97 @@ from pc_skeletor import skeletor
 import numpy as np
 import open3d as o3d
 import glob
-from scipy.sparse.csgraph import minimum_spanning_tree
-from scipy.spatial import distance_matrix
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+from scipy.spatial import cKDTree
 
-input_files = sorted(glob.glob("./clean/*.ply"))
+"""
+Usage: python laplace_skeleton.py [workers]
+Extracts the skeletons of ./clean/*.ply and stores the nodes and the edges of their minimum spanning tree in <idx>.npz.
+The spanning tree is computed from the k nearest neighbours of every point (exact, see mst_edges), so the memory grows linearly with the number of skeleton points.
+"""
 
-print("Files: ", input_files)
-
-# Init tree skeletonizer
-skeletor = skeletor.Skeletonizer(point_cloud=None,
-                                     down_sample=0.0001,
-                                     debug=False)
+# neighbours per point queried up front, points far from other components query more of them in mst_edges
+KNN = 8
 
 laplacian_config = {"MAX_LAPLACE_CONTRACTION_WEIGHT": 1024*0.5,
                     "MAX_POSITIONAL_WEIGHT": 1024*2,
                     "INIT_LAPLACIAN_SCALE": 10}
 
-for idx, file in enumerate(input_files):
+# one skeletonizer per process
+_skeletonizer = None
+
+def get_skeletonizer():
+    global _skeletonizer
+    if _skeletonizer is None:
+        # Init tree skeletonizer
+        _skeletonizer = skeletor.Skeletonizer(point_cloud=None,
+                                              down_sample=0.0001,
+                                              debug=False)
+    return _skeletonizer
+
+def first_outside(labels, points, dists, inds):
+    # distance and index of the closest neighbour of the points that lies in another component, inf and -1 if there is none
+    rows = np.arange(len(points))
+    outside = labels[inds] != labels[points, None]
+    first = np.argmax(outside, axis=1)
+    found = outside[rows, first]
+    return np.where(found, dists[rows, first], np.inf), np.where(found, inds[rows, first], -1)
+
+def mst_edges(points):
+    # Boruvka: in every round each component is joined by its shortest outgoing edge, which is part of the minimum spanning tree.
+    # The edges are looked up in the k nearest neighbours of every point. A point without a neighbour in another component
+    # could still have the shortest outgoing edge if its k-th neighbour is closer than the best edge found so far,
+    # only for these points more neighbours are queried. So the tree is the exact one of the dense distance matrix.
+    if len(points) < 2:
+        return np.zeros((0, 2), dtype=np.int32)
+
+    tree = cKDTree(points)
+    k = min(KNN, len(points) - 1)
+    dists, inds = tree.query(points, k=k + 1)
+    dists, inds = dists[:, 1:], inds[:, 1:]
+
+    tree_rows, tree_cols, tree_dists = [], [], []
+    num_components, labels = len(points), np.arange(len(points))
+    while num_components > 1:
+        candidate, neighbour = first_outside(labels, np.arange(len(points)), dists, inds)
+        best = np.full(num_components, np.inf)
+        np.minimum.at(best, labels, candidate)
+
+        # points whose neighbour lists end before the best edge of their component, with twice as many neighbours per pass
+        query_k = k
+        unresolved = np.flatnonzero(np.isinf(candidate) & (dists[:, -1] < best[labels]))
+        while len(unresolved) > 0:
+            query_k = min(2 * query_k, len(points) - 1)
+            more_dists, more_inds = tree.query(points[unresolved], k=query_k + 1)
+            more_dists, more_inds = more_dists[:, 1:], more_inds[:, 1:]
+            candidate[unresolved], neighbour[unresolved] = first_outside(labels, unresolved, more_dists, more_inds)
+
+            np.minimum.at(best, labels[unresolved], candidate[unresolved])
+            unresolved = unresolved[np.isinf(candidate[unresolved]) & (more_dists[:, -1] < best[labels[unresolved]])]
+
+        # the point with the shortest outgoing edge of every component
+        order = np.lexsort((candidate, labels))
+        best_point = order[np.searchsorted(labels[order], np.arange(num_components))]
+        tree_rows.append(best_point)
+        tree_cols.append(neighbour[best_point])
+        tree_dists.append(candidate[best_point])
+
+        # duplicate points have distance 0, which the sparse graph would treat as missing edge
+        graph = coo_matrix((np.maximum(np.concatenate(tree_dists), 1e-12), (np.concatenate(tree_rows), np.concatenate(tree_cols))),
+                           shape=(len(points), len(points))).tocsr()
+        num_components, labels = connected_components(graph, directed=False)
+
+    # edges of equal length can close a cycle within a round, the spanning tree of the collected edges removes it
+    mst = minimum_spanning_tree(graph.maximum(graph.T)).tocoo()
+
+    edges = np.stack([mst.row, mst.col], axis=1)
+    return np.sort(edges, axis=1).astype(np.int32)
+
+def skeletonize(job):
+    idx, file = job
     print("Reading: ", file)
     pcd = o3d.io.read_point_cloud(file)
 
@@ -26,22 +100,34 @@ for idx, file in enumerate(input_files):
     print("Number of points: ", np.asarray(pcd.points).shape[0])
 
     # extract the skeleton points using Laplacian contraction
-    skeletor.pcd = pcd
-    sceleton = skeletor.extract(method='Laplacian', config=laplacian_config)
+    skeletonizer = get_skeletonizer()
+    skeletonizer.pcd = pcd
+    sceleton = skeletonizer.extract(method='Laplacian', config=laplacian_config)
 
     skeleton = np.asarray(sceleton[1].points)
 
-    # calculate the distances between all the points
-    C = distance_matrix(skeleton, skeleton)
+    # the minimum spanning tree is stored as undirected edge list instead of a dense adjacency matrix
+    edges = mst_edges(skeleton)
+
+    # save to a npz file
+    np.savez_compressed(f"{idx}.npz", nodes=skeleton.astype(np.float32), edges=edges)
+    return file, len(skeleton)
 
-    # calculate the adjacency matrix and convert it to binary
-    mst = minimum_spanning_tree(C).toarray()
-    mst = mst > 0
+def main(argv):
+    workers = int(argv[1]) if len(argv) > 1 else 1
 
-    # convert the directed graph to an undirected graph
-    mst = np.maximum(mst, mst.T)
+    input_files = sorted(glob.glob("./clean/*.ply"))
 
-    # save to a npz file
-    np.savez_compressed(f"{idx}.npz", nodes=skeleton, adj=mst)
+    print("Files: ", input_files)
 
+    jobs = list(enumerate(input_files))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file, num_nodes in executor.map(skeletonize, jobs):
+                print("Done: {} ({} nodes)".format(file, num_nodes))
+    else:
+        for job in jobs:
+            skeletonize(job)
 
+if __name__ == "__main__":
+    main(sys.argv)
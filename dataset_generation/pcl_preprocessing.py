@@ -1,14 +1,23 @@
 import open3d as o3d
 import numpy as np
-import itertools
 import sys
 import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
+"""
+Usage: python pcl_preprocessing.py "<input glob>" <output prefix> [workers]
+The cleaned files are written to <output prefix>000.ply, <output prefix>001.ply, ... in the sorted order of the input files.
+"""
+
 Z_THRESH_LOW = 0.000142*3 #0.00025
 Z_THRESH_HIGH = 0.1
 STATISTICAL_REMOVAL_NB_NEIGHBOURS = 30
 STATISTICAL_REMOVAL_STD_RATIO = 2.0
+PLANE_DISTANCE_THRESHOLD = 0.005
+# estimate the ground height from the inliers of the first plane fit instead of a second RANSAC
+FAST_GROUND_FIT = True
 
 def rot_matrix_from_normals(current_normal: np.array, new_normal: np.array):
     v = np.cross(current_normal, new_normal)
@@ -23,65 +32,94 @@ def rot_matrix_from_normals(current_normal: np.array, new_normal: np.array):
     return np.eye(3) + cross_mat + np.matmul(cross_mat, cross_mat) / (1 + cosine)
 
 def crop_z(pcd, low, high):
-    bounds = [[-np.inf, np.inf], [-np.inf, np.inf], [low, high]]  # set the bounds
-    bounding_box_points = list(itertools.product(*bounds))  # create limit points
-    bounding_box = o3d.geometry.AxisAlignedBoundingBox.create_from_points(
-        o3d.utility.Vector3dVector(bounding_box_points))  # create bounding box object
-
-    # Crop the point cloud using the bounding box:
-    return pcd.crop(bounding_box)
-
-def main(argv):
-    input_ply = argv[1] if len(argv) > 1 else "in.ply"
-    output_ply = argv[2] if len(argv) > 2 else "out.ply"
-
-    input_files = glob.glob(input_ply)
+    # only z is bounded, so a mask over the points does the same as cropping with an infinite bounding box
+    z = np.asarray(pcd.points)[:, 2]
+    return pcd.select_by_index(np.flatnonzero((z >= low) & (z <= high)))
+
+def fit_ground_offset(z, threshold):
+    # robust 1-D fit of the ground height: the median of the plane points, refined by the mean of the points close to it
+    z0 = np.median(z)
+    close = np.abs(z - z0) < threshold
+    return np.mean(z[close]) if close.any() else z0
+
+def preprocess(file, output_ply):
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = now - start
+        start = now
+
+    # scale the pointcloud to meters
+    pcd = o3d.io.read_point_cloud(file)
+    lap("read")
+
+    # rotate the cloud to be parallel to the ground
+    [a, b, c, d], plane_ind = pcd.segment_plane(distance_threshold=PLANE_DISTANCE_THRESHOLD, ransac_n=3, num_iterations=10000)
+    normal = [a, b, c]
+    normal /= np.linalg.norm(normal)
+    pcd = pcd.rotate(rot_matrix_from_normals(normal, [0, 0, -1]), center=(0, 0, 0))
+    lap("plane_fit")
+
+    # move the groundplane to zero
+    if FAST_GROUND_FIT:
+        # after the rotation the normal of the ground is known, only its height has to be fitted
+        ground_z = np.asarray(pcd.points)[plane_ind, 2]
+        pcd = pcd.translate((0, 0, -fit_ground_offset(ground_z, PLANE_DISTANCE_THRESHOLD)))
+    else:
+        # the plane detection is done again, because otherwise the error on the z axis would be too high
+        [a, b, c, d], plane_ind = pcd.segment_plane(distance_threshold=0.05, ransac_n=3, num_iterations=1000)
+        pcd = pcd.translate((0, 0, d))
+    lap("ground_offset")
 
-    for idx, file in enumerate(tqdm(input_files)):
+    # crop the z axis to remove the ground and things above
+    pcd = crop_z(pcd, Z_THRESH_LOW, Z_THRESH_HIGH)
+    lap("crop")
 
-        mesh = o3d.geometry.TriangleMesh.create_coordinate_frame()
-        mesh = mesh.scale(0.05, center=[0, 0, 0])
+    # remove outliers
+    _, ind = pcd.remove_statistical_outlier(
+        nb_neighbors=STATISTICAL_REMOVAL_NB_NEIGHBOURS,
+        std_ratio=STATISTICAL_REMOVAL_STD_RATIO
+    )
+    pcd = pcd.select_by_index(ind)
+    lap("outlier_removal")
 
-        # scale the pointcloud to meters
-        pcd = o3d.io.read_point_cloud(file)
+    # center pointcloud along x, y axis
+    [dx, dy, _] = pcd.get_center()
+    pcd = pcd.translate((-dx, -dy, 0))
+    pcd.paint_uniform_color([0.8, 0.8, 0.8])
 
-        # rotate the cloud to be parallel to the ground
-        [a, b, c, d], plane_ind = pcd.segment_plane(distance_threshold=0.005, ransac_n=3, num_iterations=10000)
-        normal = [a, b, c]
-        normal /= np.linalg.norm(normal)
-        pcd = pcd.rotate(rot_matrix_from_normals(normal, [0, 0, -1]), center=(0, 0, 0))
+    # print("Saving to '{}'".format(output_ply))
+    o3d.io.write_point_cloud(output_ply, pcd)
+    lap("write")
 
-        plane = o3d.geometry.PointCloud()
-        plane = pcd.select_by_index(plane_ind)
+    return timings
 
-        # move the groundplane to zero
-        # the plane detection is done again, because otherwise the error on the z axis would be too high
-        [a, b, c, d], plane_ind = pcd.segment_plane(distance_threshold=0.05, ransac_n=3, num_iterations=1000)
-        pcd = pcd.translate((0, 0, d))
+def _preprocess_job(job):
+    return preprocess(*job)
 
-        # crop the z axis to remove the ground and things above
-        pcd = crop_z(pcd, Z_THRESH_LOW, Z_THRESH_HIGH)
-
-        # remove outliers
-        _, ind = pcd.remove_statistical_outlier(
-            nb_neighbors=STATISTICAL_REMOVAL_NB_NEIGHBOURS,
-            std_ratio=STATISTICAL_REMOVAL_STD_RATIO
-        )
-
-        outlier_cloud = pcd.select_by_index(ind, invert=True)
-        outlier_cloud.paint_uniform_color([1, 0, 0])
-        pcd = pcd.select_by_index(ind)
-        # center pointcloud along x, y axis
-        [dx, dy, _] = pcd.get_center()
-        pcd = pcd.translate((-dx, -dy, 0))
-        pcd.paint_uniform_color([0.8, 0.8, 0.8])
-        outlier_cloud = outlier_cloud.translate((-dx, -dy, 0))
-
-        # o3d.visualization.draw_geometries([mesh, pcd, outlier_cloud])
-        output_ply = argv[2]
-        output_ply += "{:03d}".format(idx) + ".ply"
-        # print("Saving to '{}'".format(output_ply))
-        o3d.io.write_point_cloud(output_ply, pcd)
+def main(argv):
+    input_ply = argv[1] if len(argv) > 1 else "in.ply"
+    output_ply = argv[2] if len(argv) > 2 else "out.ply"
+    workers = int(argv[3]) if len(argv) > 3 else 1
+
+    # sorted, so the output numbering does not depend on the file system and the workers
+    input_files = sorted(glob.glob(input_ply))
+    jobs = [(file, output_ply + "{:03d}".format(idx) + ".ply") for idx, file in enumerate(input_files)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            all_timings = list(tqdm(executor.map(_preprocess_job, jobs), total=len(jobs)))
+    else:
+        all_timings = [_preprocess_job(job) for job in tqdm(jobs)]
+
+    if len(all_timings) > 0:
+        print("Time per stage (summed over {} files, {} workers):".format(len(all_timings), workers))
+        for stage in all_timings[0]:
+            total = sum(t[stage] for t in all_timings)
+            print("{: <16} {:8.2f}s  ({:.3f}s per file)".format(stage, total, total / len(all_timings)))
 
 
 if __name__ == "__main__":